@@ -0,0 +1,16 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+STACK_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(STACK_DIR))
+
+
+@pytest.fixture
+def stack(tmp_path):
+    """A copy of the titanium-stg stack's .tf files in a scratch directory."""
+    for tf_file in STACK_DIR.glob("*.tf"):
+        shutil.copy(tf_file, tmp_path)
+    return tmp_path
@@ -0,0 +1,45 @@
+import pytest
+
+import vm_analyzer
+from vm_analyzer import VM, Topology, allocate_host_pins, check_smt_sharing, parse_affinity
+
+
+def vm(name, cpu, affinity=""):
+    return VM(name=name, host_node="smt", role="worker", ip="", cpu=cpu, cpu_affinity=affinity,
+              numa=False, ram_dedicated=1024, disk_size=10, bandwidth_limit=0, datastore_id="local-lvm")
+
+
+@pytest.fixture
+def smt_host(monkeypatch):
+    """16 CPUs on 2 NUMA nodes, with CPU i and i+8 sharing a physical core."""
+    topology = Topology([parse_affinity("0-3,8-11"), parse_affinity("4-7,12-15")], [16384, 16384],
+                        [parse_affinity(f"{i},{i + 8}") for i in range(8)])
+    monkeypatch.setitem(vm_analyzer.NODES, "smt", {"sockets": 2, "cores": 16, "memory": 32768})
+    monkeypatch.setitem(vm_analyzer._TOPOLOGIES, "smt", topology)
+    return topology
+
+
+def pinned(host_vms, assignments):
+    return [vm(v.name, v.cpu, a.affinity) for v, a in zip(host_vms, assignments)]
+
+
+def test_vms_get_whole_cores_on_smt_hosts(smt_host):
+    host_vms = [vm(name, 2) for name in "abcdef"]
+    assignments = allocate_host_pins("smt", host_vms, reserve_cores=0)
+    assert [a.affinity for a in assignments] == ["0,8", "1,9", "2,10", "3,11", "4,12", "5,13"]
+    assert all(a.note == "" for a in assignments)
+    assert check_smt_sharing("smt", pinned(host_vms, assignments)) == []
+
+
+def test_free_cores_on_other_nodes_come_before_occupied_siblings(smt_host):
+    host_vms = [vm("big", 6), vm("a", 2), vm("b", 2), vm("c", 2)]
+    assignments = allocate_host_pins("smt", host_vms, reserve_cores=0)
+    assert check_smt_sharing("smt", pinned(host_vms, assignments)) == []
+    assert all(parse_affinity(a.affinity).bit_count() == v.cpu for v, a in zip(host_vms, assignments))
+
+
+def test_siblings_are_shared_only_when_no_whole_core_is_left(smt_host):
+    host_vms = [vm("big", 15), vm("small", 1)]
+    assignments = allocate_host_pins("smt", host_vms, reserve_cores=0)
+    assert [a.status for a in assignments] == ["assigned", "assigned"]
+    assert "shares SMT cores" in assignments[1].note
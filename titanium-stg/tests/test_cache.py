@@ -0,0 +1,21 @@
+from vm_analyzer import ParseCache, parse_files
+
+
+def test_cached_file_is_served_until_it_changes(stack, tmp_path_factory):
+    cache_file = tmp_path_factory.mktemp("cache") / "parse-cache.json"
+    tf_file = stack / "lxc.tf"
+    parse_files([tf_file], cache=ParseCache(cache_file))
+
+    cache = ParseCache(cache_file)
+    assert [vm.name for vm in cache.lookup(tf_file).vms] == ["nginx_master_lb"]
+    tf_file.write_text(tf_file.read_text() + "\n# edited\n")
+    assert cache.lookup(tf_file) is None
+
+
+def test_lookup_of_removed_file_is_a_miss(stack, tmp_path_factory):
+    cache_file = tmp_path_factory.mktemp("cache") / "parse-cache.json"
+    tf_file = stack / "lxc.tf"
+    parse_files([tf_file], cache=ParseCache(cache_file))
+
+    tf_file.unlink()
+    assert ParseCache(cache_file).lookup(tf_file) is None
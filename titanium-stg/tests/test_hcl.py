@@ -0,0 +1,86 @@
+import pytest
+
+from vm_analyzer import HclBlock, HclExpr, HclSyntaxError, parse_hcl, scan_stacks
+
+
+def attrs(text):
+    return parse_hcl(text).blocks[0].attributes
+
+
+def test_comments_are_skipped():
+    block = parse_hcl('# hash\n// slash\n/* block\n   comment */\nlocals {\n  a = 1 # trailing\n}\n')
+    assert block.blocks[0].attributes == {"a": 1}
+
+
+def test_heredoc_keeps_indentation():
+    assert attrs('locals {\n  a = <<EOT\n  hello\nEOT\n}\n') == {"a": "  hello\n"}
+
+
+def test_indented_heredoc_is_dedented():
+    assert attrs('locals {\n  a = <<-EOT\n    x\n      y\n    EOT\n}\n') == {"a": "x\n  y\n"}
+
+
+def test_for_expressions_are_kept_as_expressions():
+    values = attrs('locals {\n'
+                   '  a = [for s in var.list : upper(s) if s != ""]\n'
+                   '  b = {for k, v in var.map : k => v}\n'
+                   '}\n')
+    assert values == {"a": HclExpr('[for s in var.list : upper(s) if s != ""]'),
+                      "b": HclExpr("{for k, v in var.map : k => v}")}
+
+
+def test_dynamic_block():
+    block = parse_hcl('resource "x" "y" {\n'
+                      '  dynamic "disk" {\n'
+                      '    for_each = var.disks\n'
+                      '    content {\n'
+                      '      size = disk.value\n'
+                      '    }\n'
+                      '  }\n'
+                      '}\n')
+    dynamic = block.blocks[0].blocks[0]
+    assert (dynamic.type, dynamic.labels) == ("dynamic", ["disk"])
+    assert dynamic.attributes == {"for_each": HclExpr("var.disks")}
+    assert dynamic.blocks == [HclBlock("content", attributes={"size": HclExpr("disk.value")})]
+
+
+def test_computed_and_quoted_object_keys():
+    values = attrs('locals {\n  a = { (var.k) = 1, "x" = 2, 3 = "n" }\n}\n')
+    assert values["a"].attributes == {"(var.k)": 1, "x": 2, "3": "n"}
+
+
+def test_template_strings_are_expressions():
+    values = attrs('locals {\n  ip = "${local.base}.5"\n  doc = <<EOT\n${var.x}\nEOT\n}\n')
+    assert values["ip"] == HclExpr('"${local.base}.5"')
+    assert isinstance(values["doc"], HclExpr)
+
+
+def test_string_escapes():
+    values = attrs('locals {\n'
+                   '  a = "$${literal}"\n'
+                   '  b = "caf\\u00e9 \\U0001F600"\n'
+                   '  c = "tab\\there"\n'
+                   '  d = <<EOT\n$${literal}\nEOT\n'
+                   '}\n')
+    assert values == {"a": "${literal}", "b": "caf\u00e9 \U0001F600", "c": "tab\there", "d": "${literal}\n"}
+
+
+@pytest.mark.parametrize("text, message", [
+    ('locals {\n  a = {\n', "expected '}' before end of file"),
+    ('locals {\n  a = "x\n}\n', "unterminated string"),
+    ('locals {\n  a = "${x"\n}\n', "unterminated"),
+])
+def test_syntax_errors_carry_source_and_line(text, message):
+    with pytest.raises(HclSyntaxError) as excinfo:
+        parse_hcl(text, "broken.tf")
+    assert excinfo.value.source == "broken.tf"
+    assert excinfo.value.line >= 1
+    assert message in excinfo.value.message
+
+
+def test_broken_file_becomes_finding_and_others_are_analyzed(stack):
+    (stack / "broken.tf").write_text('locals {\n  x = {\n')
+    fleet = scan_stacks([stack])
+    assert [(f.severity, f.check) for f in fleet.errors] == [("critical", "hcl_syntax")]
+    assert fleet.errors[0].message.startswith("broken.tf:")
+    assert any(vm.name == "nginx_master_lb" for vms in fleet.stacks.values() for vm in vms)
@@ -0,0 +1,30 @@
+import vm_analyzer
+from vm_analyzer import VM, check_kubelet_capacity, kubelet_capacity
+
+
+def worker(cpu, memory, **kubelet_args):
+    return VM(name="worker-0", host_node="ayumu", role="worker", ip="", cpu=cpu, cpu_affinity="", numa=False,
+              ram_dedicated=memory, disk_size=30, bandwidth_limit=0, datastore_id="local-lvm", workload="tier-0",
+              kubelet_args={key.replace("_", "-"): value for key, value in kubelet_args.items()})
+
+
+def test_overhead_is_charged_for_the_pods_that_fit_not_max_pods(monkeypatch):
+    monkeypatch.setattr(vm_analyzer, "POD_SIZE", (1000, 1024))
+    vm = worker(4, 4096, max_pods="250", kube_reserved="memory=1Gi", system_reserved="memory=1Gi")
+    cap = kubelet_capacity(vm)
+    assert cap.allocatable_memory == 4096 - 2048 - 100
+    assert cap.workload_memory == cap.allocatable_memory - cap.conntrack_memory
+    assert cap.pods_fit(1000, 1024) == 1
+    assert check_kubelet_capacity("ayumu", [vm]) == []
+
+
+def test_memory_bound_pods_pay_their_own_overhead(monkeypatch):
+    monkeypatch.setattr(vm_analyzer, "POD_SIZE", (100, 64))
+    vm = worker(32, 16384, max_pods="250")
+    cap = kubelet_capacity(vm)
+    per_pod = 64 + vm_analyzer.POD_OVERHEAD_PER_POD
+    assert cap.pods_fit(100, 64) == cap.workload_memory // per_pod == 225
+    assert cap.pods_scheduled(100, 64) == 250
+    [finding] = check_kubelet_capacity("ayumu", [vm])
+    assert finding.severity == "warning"
+    assert "250 scheduled pods" in finding.message and "only 225 of them fit" in finding.message
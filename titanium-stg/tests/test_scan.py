@@ -0,0 +1,12 @@
+import shutil
+
+from vm_analyzer import scan_stacks
+
+
+def test_stacks_with_the_same_directory_name_are_kept_apart(stack, tmp_path_factory):
+    prod = tmp_path_factory.mktemp("prod")
+    for region in ("eu", "us"):
+        shutil.copytree(stack, prod / region / "k8s")
+    fleet = scan_stacks([prod / "eu" / "k8s", prod / "us" / "k8s"])
+    assert sorted(fleet.stacks) == ["eu/k8s", "us/k8s"]
+    assert fleet.stack_counts()["eu/k8s"] == fleet.stack_counts()["us/k8s"] > 0
@@ -0,0 +1,56 @@
+import io
+import json
+
+import pytest
+
+from vm_analyzer import JsonStream, parse_tf_json
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64])
+def test_skip_value_handles_strings_cut_by_chunk_boundaries(chunk_size):
+    skipped = {"a": ["x\\\"]}{[" * 5, 'tail \\', {"b": "\"" * 9}], "c": "q" * 200}
+    stream = JsonStream(io.StringIO(json.dumps([skipped, {"kept": 1}])), chunk_size=chunk_size)
+    values = []
+    for i, _ in enumerate(stream.iter_array()):
+        if i == 0:
+            stream.skip_value()
+        else:
+            values.append(stream.read_value())
+    assert values == [{"kept": 1}]
+
+
+def worker_state(config_patches):
+    module = "module.talos_worker"
+    return {"values": {"root_module": {"child_modules": [{"address": module, "resources": [
+        {"address": f'{module}.proxmox_virtual_environment_vm.worker["w-0"]', "mode": "managed",
+         "type": "proxmox_virtual_environment_vm", "name": "worker", "index": "w-0",
+         "values": {"name": "w-0", "node_name": "ayumu", "tags": ["talos", "worker", "stg", "tier-0"],
+                    "cpu": [{"cores": 4}], "memory": [{"dedicated": 8192}]}},
+        {"address": f'{module}.talos_machine_configuration_apply.worker["w-0"]', "mode": "managed",
+         "type": "talos_machine_configuration_apply", "name": "worker", "index": "w-0",
+         "values": {"config_patches": config_patches}},
+    ]}]}}}
+
+
+def test_worker_fields_come_from_the_applied_machine_config():
+    pytest.importorskip("yaml")
+    patch = ('"machine":\n'
+             '  "kubelet":\n'
+             '    "extraArgs":\n'
+             '      "max-pods": "250"\n'
+             '      "register-with-taints": "workload=tier-0:NoSchedule"\n'
+             '  "nodeLabels":\n'
+             '    "workload": "tier-0"\n'
+             '  "sysctls":\n'
+             '    "net.netfilter.nf_conntrack_max": "262144"\n')
+    [vm] = parse_tf_json(io.StringIO(json.dumps(worker_state([patch]))))
+    assert vm.role == "worker"
+    assert vm.workload == "tier-0"
+    assert vm.kubelet_args == {"max-pods": "250"}
+    assert vm.sysctls == {"net.netfilter.nf_conntrack_max": "262144"}
+
+
+def test_worker_workload_falls_back_to_the_vm_tags():
+    [vm] = parse_tf_json(io.StringIO(json.dumps(worker_state(None))))
+    assert vm.workload == "tier-0"
+    assert vm.kubelet_args == {} and vm.sysctls == {}
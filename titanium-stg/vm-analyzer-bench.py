@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+VM Analyzer benchmark - times parsing, analysis and rendering of a synthetic fleet.
+
+Usage: python3 vm-analyzer-bench.py [--save] [--baseline PATH]
+       python3 vm-analyzer-bench.py --generate-fleet DIR
+
+Baselines are kept per scenario in bench-baseline.json next to this script,
+so they can be committed with the code they measure; a run exits 1 when a
+phase regressed against its scenario's baseline.
+"""
+
+import io
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import vm_analyzer
+from vm_analyzer import Colors, build_report, load_nodes, parse_tf_files, render_text
+
+BENCH_PHASES = ("parse", "analysis", "render")
+BENCH_REGRESSION = 0.25  # relative slowdown or memory growth reported as a regression
+BENCH_MIN_DELTA = 0.005  # seconds; smaller slowdowns are timer noise
+DEFAULT_BASELINE_FILE = Path(__file__).resolve().parent / "bench-baseline.json"
+BASELINE_VERSION = 1
+
+# Smallest node shape of a generated host; hosts grow by whole NUMA nodes to hold their VMs
+BENCH_NODE = {"cores": 128, "memory": 1048576, "sockets": 2}
+BENCH_NUMA_CPUS = BENCH_NODE["cores"] // BENCH_NODE["sockets"]
+BENCH_NODES_FILE = "nodes.json"
+
+def bench_hosts(hosts: int) -> List[str]:
+    return [f"bench-{i:02d}" for i in range(hosts)]
+
+def _vm_block(name: str, attrs: List[str], disks: List[str], commented: bool) -> List[str]:
+    lines = [f'      "{name}" = {{'] + [f"        {a}" for a in attrs]
+    if disks:
+        lines.append("        additional_disks = {")
+        lines += disks
+        lines.append("        }")
+    lines.append("      }")
+    if commented:
+        lines = ["#" + line for line in lines]
+    return lines
+
+def generate_fleet(out_dir: Path, hosts: int = 10, vms: int = 1000, disks: int = 2,
+                   commented: float = 0.1, seed: int = 0) -> int:
+    """Write talos-master.tf/talos-worker.tf-shaped files describing a synthetic fleet.
+
+    Three masters plus workers spread round-robin over the hosts, each worker
+    with `disks` additional disks; a `commented` fraction of the worker blocks
+    is commented out as in the real stacks. Pins never overlap within a host
+    and each stays inside one BENCH_NUMA_CPUS-sized NUMA node; the node
+    inventory written to BENCH_NODES_FILE (load it with --nodes) gives every
+    host at least BENCH_NODE, one socket per NUMA node it needs, and enough
+    memory for its VMs. Returns the number of live VMs.
+    """
+    import json
+    import random
+    rng = random.Random(seed)
+    names = bench_hosts(hosts)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    memory = dict.fromkeys(names, 0)
+
+    masters = ["module \"talos_master\" {", "  master_vms = {"]
+    for host in names[:3]:
+        masters.append(f'    "{host}" = {{')
+        for i in range(3)[names.index(host)::hosts]:
+            memory[host] += 4096
+            masters += _vm_block(f"master-{i}", [
+                f'ip              = "10.0.0.{10 + i}"', "cpu             = 2", "numa            = true",
+                f'cpu_affinity    = "{2 * i}-{2 * i + 1}"', "ram_dedicated   = 4096", "disk_size       = 20",
+                "bandwidth_limit = 0", 'datastore_id    = "local-lvm"'], [], False)
+        masters.append("    }")
+    masters += ["  }", "}"]
+    (out_dir / "talos-master.tf").write_text("\n".join(masters) + "\n")
+
+    per_host: Dict[str, List[str]] = {host: [] for host in names}
+    # Next free CPU as (NUMA node, CPU within it); the masters hold CPUs 0-5
+    next_cpu = {host: (0, 6) for host in names}
+    live = 3
+    for i in range(max(vms - 3, 0)):
+        host = names[i % hosts]
+        cpu = rng.choice((2, 4, 8))
+        node, used = next_cpu[host]
+        if used + cpu > BENCH_NUMA_CPUS:
+            node, used = node + 1, 0
+        first = node * BENCH_NUMA_CPUS + used
+        next_cpu[host] = (node, used + cpu)
+        ram = rng.choice((4096, 8192, 16384))
+        is_commented = rng.random() < commented
+        live += not is_commented
+        memory[host] += 0 if is_commented else ram
+        disk_lines = []
+        for d in range(disks):
+            disk_lines += [f'          "disk-{d}" = {{', f"            size         = {rng.choice((30, 40, 100))}",
+                           '            datastore_id = "local-lvm"', '            filesystem   = "xfs"',
+                           "          }" + ("," if d < disks - 1 else "")]
+        per_host[host] += _vm_block(f"worker-{i}", [
+            f'ip              = "10.{1 + i // 65025}.{i // 255 % 255}.{i % 255 + 1}"', f"cpu             = {cpu}",
+            "numa            = true", f'cpu_affinity    = "{first}-{first + cpu - 1}"',
+            f"ram_dedicated   = {ram}", f"disk_size       = {rng.choice((20, 30, 50))}",
+            f"bandwidth_limit = {rng.choice((0, 100, 1000))}", 'datastore_id    = "local-lvm"',
+            f'workload        = "{rng.choice(("tier-0", "tier-naufal"))}"'], disk_lines, is_commented)
+
+    workers = ["module \"talos_worker\" {", "  worker_config = {", "    sysctls = {",
+               '      "net.netfilter.nf_conntrack_max" = "524288"', "    }", "    kubelet_extraArgs = {",
+               '      max-pods: "250"', '      cpu-manager-policy: "static"',
+               '      eviction-hard: "memory.available<500Mi,nodefs.available<10%"', "    }", "  }",
+               "  worker_config_workload = {",
+               '    "tier-0" = {', "      kubelet_extraArgs = {",
+               '        kube-reserved: "cpu=600m,memory=1Gi"', '        system-reserved: "cpu=500m,memory=1Gi"',
+               "      }", "    }",
+               '    "tier-naufal" = {', "      kubelet_extraArgs = {",
+               '        reserved-cpus: "1"', '        kube-reserved: "memory=1Gi"', '        system-reserved: "memory=1Gi"',
+               "      }", "    }", "  }",
+               "  worker_vms = {"]
+    for host in names:
+        workers.append(f'    "{host}" = {{')
+        workers += per_host[host]
+        workers.append("    }")
+    workers += ["  }", "}"]
+    (out_dir / "talos-worker.tf").write_text("\n".join(workers) + "\n")
+
+    # The analyzer splits a host's CPUs evenly over its sockets, one NUMA node each
+    nodes = {}
+    for host in names:
+        sockets = max(BENCH_NODE["sockets"], next_cpu[host][0] + 1)
+        nodes[host] = {**BENCH_NODE, "sockets": sockets, "cores": sockets * BENCH_NUMA_CPUS,
+                       "memory": max(BENCH_NODE["memory"], memory[host])}
+    (out_dir / BENCH_NODES_FILE).write_text(json.dumps(nodes, indent=2) + "\n")
+    return live
+
+def clear_memos(vms: List[vm_analyzer.VM]):
+    """Drop what an analysis run memoizes, so every timed repeat does the full work."""
+    for vm in vms:
+        vm.__dict__.pop("affinity_mask", None)
+    vm_analyzer._KUBELET_CAPACITIES.clear()
+
+def _measure(fn, repeat: int, reset=None) -> Tuple[object, float, int]:
+    """Best wall time over repeat runs, then peak traced memory of one more run.
+
+    reset, if given, runs untimed before every run.
+    """
+    import tracemalloc
+    best = float("inf")
+    for _ in range(repeat):
+        if reset:
+            reset()
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    if reset:
+        reset()
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, best, peak
+
+def run_benchmark(hosts: int, vms: int, disks: int, commented: float,
+                  repeat: int = 5) -> Tuple[int, Dict[str, dict]]:
+    """Time parsing, analysis and rendering of a generated fleet separately.
+
+    Returns the number of parsed VMs and {phase: {"seconds", "peak_bytes"}}.
+    """
+    import tempfile
+    with tempfile.TemporaryDirectory(prefix="vm-analyzer-bench-") as tmp:
+        directory = Path(tmp)
+        generate_fleet(directory, hosts, vms, disks, commented)
+        load_nodes(directory / BENCH_NODES_FILE)
+        parsed, parse_s, parse_peak = _measure(lambda: parse_tf_files(directory), repeat)
+    report, analysis_s, analysis_peak = _measure(lambda: build_report(parsed, {"bench": len(parsed)}), repeat,
+                                                 reset=lambda: clear_memos(parsed))
+    _, render_s, render_peak = _measure(lambda: render_text(report, io.StringIO()), repeat)
+    return len(parsed), {
+        "parse": {"seconds": parse_s, "peak_bytes": parse_peak},
+        "analysis": {"seconds": analysis_s, "peak_bytes": analysis_peak},
+        "render": {"seconds": render_s, "peak_bytes": render_peak},
+    }
+
+def bench_scenario(hosts: int, vms: int, disks: int, commented: float) -> str:
+    return f"{hosts}h-{vms}vm-{disks}d-{commented:g}c"
+
+def load_baselines(path: Path) -> Dict[str, dict]:
+    import json
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return data.get("scenarios", {}) if data.get("version") == BASELINE_VERSION else {}
+
+def save_baseline(path: Path, scenario: str, results: Dict[str, dict]):
+    scenarios = load_baselines(path)
+    scenarios[scenario] = results
+    import json
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"version": BASELINE_VERSION, "scenarios": scenarios}, indent=2) + "\n")
+
+def print_benchmark(scenario: str, vm_count: int, results: Dict[str, dict],
+                    baseline: Optional[Dict[str, dict]]) -> List[str]:
+    """Print the phase timings next to the baseline; return the phases that regressed."""
+    print(f"{Colors.BOLD}Benchmark {scenario}{Colors.RESET} ({vm_count} VMs)\n")
+    print(f"  {'Phase':<10} {'Time':>10} {'Peak mem':>10}   {'Baseline':>10} {'Change':>8}")
+    print(f"  {'-'*10} {'-'*10} {'-'*10}   {'-'*10} {'-'*8}")
+    regressions = []
+    for phase in BENCH_PHASES:
+        cur = results[phase]
+        line = f"  {phase:<10} {cur['seconds'] * 1000:>8.1f}ms {cur['peak_bytes'] / 2**20:>8.1f}MB"
+        base = (baseline or {}).get(phase)
+        if base:
+            change = cur["seconds"] / base["seconds"] - 1 if base["seconds"] else 0.0
+            slower = (change > BENCH_REGRESSION and cur["seconds"] - base["seconds"] > BENCH_MIN_DELTA)
+            bigger = base["peak_bytes"] and cur["peak_bytes"] > base["peak_bytes"] * (1 + BENCH_REGRESSION)
+            color = Colors.RED if slower or bigger else Colors.GREEN
+            line += f"   {base['seconds'] * 1000:>8.1f}ms {color}{change:>+7.0%}{Colors.RESET}"
+            if slower or bigger:
+                regressions.append(phase)
+                line += f" {Colors.RED}{'slower' if slower else 'more memory'}{Colors.RESET}"
+        print(line)
+    print()
+    if baseline is None:
+        print("  No baseline for this scenario yet (store one with --save)\n")
+    elif regressions:
+        print(f"  {Colors.RED}Regression in: {', '.join(regressions)}{Colors.RESET}\n")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the VM analyzer on a synthetic fleet")
+    parser.add_argument("--generate-fleet", metavar="DIR", help="Only write the synthetic fleet's .tf files into DIR")
+    parser.add_argument("--fleet-hosts", type=int, default=10, help="Hosts in the synthetic fleet")
+    parser.add_argument("--fleet-vms", type=int, default=1000, help="VMs in the synthetic fleet")
+    parser.add_argument("--fleet-disks", type=int, default=2, help="Additional disks per synthetic VM")
+    parser.add_argument("--fleet-commented", type=float, default=0.1, help="Fraction of synthetic VM blocks commented out")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per phase (the best one counts)")
+    parser.add_argument("--baseline", type=str, default=str(DEFAULT_BASELINE_FILE),
+                        help=f"Benchmark baseline file (default: {DEFAULT_BASELINE_FILE.name} next to this script)")
+    parser.add_argument("--save", action="store_true", help="Store this run as the scenario's baseline")
+    args = parser.parse_args()
+
+    if args.generate_fleet:
+        count = generate_fleet(Path(args.generate_fleet), args.fleet_hosts, args.fleet_vms,
+                               args.fleet_disks, args.fleet_commented)
+        nodes = Path(args.generate_fleet) / BENCH_NODES_FILE
+        print(f"Wrote {count} VMs on {args.fleet_hosts} hosts to {args.generate_fleet} "
+              f"(analyze with vm-analyzer.py --dir {args.generate_fleet} --nodes {nodes})")
+        return
+
+    scenario = bench_scenario(args.fleet_hosts, args.fleet_vms, args.fleet_disks, args.fleet_commented)
+    baseline_file = Path(args.baseline)
+    baseline = load_baselines(baseline_file).get(scenario)
+    vm_count, results = run_benchmark(args.fleet_hosts, args.fleet_vms, args.fleet_disks,
+                                      args.fleet_commented, args.repeat)
+    regressions = print_benchmark(scenario, vm_count, results, baseline)
+    if args.save:
+        save_baseline(baseline_file, scenario, results)
+        print(f"  Baseline saved to {baseline_file}\n")
+    elif regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4028 @@
+"""
+VM Analyzer - Analyzes Terraform VM configurations for resource utilization and CPU affinity.
+
+Usage: python3 vm-analyzer.py
+
+--check exits 0 when nothing is found, 3 on warnings and 4 on critical
+findings. The bundled stack places all three masters on one host, so a plain
+--check of it exits 3 on master_spread; gate CI on the checks that matter
+(e.g. --check affinity_overlap duplicate_ip ip_plan) or spread the masters.
+
+Modules only some modes need (json, ipaddress, hashlib, heapq, tracemalloc,
+urllib.parse, yaml, ...) are imported where they are used, so a --check run
+only pays for what its checks touch.
+"""
+
+import io
+import os
+import re
+import sys
+import math
+import time
+import bisect
+import argparse
+import itertools
+import textwrap
+from pathlib import Path
+from dataclasses import dataclass, field, asdict, replace
+from functools import cached_property
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, TextIO, Tuple, Optional
+from collections import defaultdict
+
+# =============================================================================
+# NODE CONFIGURATION - Define your Proxmox hosts here
+# =============================================================================
+NODES = {
+    "ayumu": {
+        "sockets": 1,
+        "cores": 16,        # Total CPU cores
+        "memory": 61440,   # Memory in MB (60GB)
+    },
+    # Add more nodes here:
+    # "node2": {
+    #     "sockets": 2,
+    #     "cores": 16,
+    #     "memory": 131072,  # 128GB
+    #     "reserved_cores": 2,  # CPUs kept free for Proxmox by --allocate
+    #     "datastores": {  # GB; limits where --place may put disks
+    #         "local-lvm": 900,
+    #         # Optional I/O budgets: random IOPS and MB/s the device sustains
+    #         "teamgroup-ssd": {"capacity": 1800, "iops": 90000, "throughput": 500},
+    #     },
+    #     "nics": {"vmbr0": 10000},  # uplink Mbit/s behind each bridge (default 1000)
+    #     "topology": "topology/node2.lscpu",  # `lscpu -p` dump, /sys/devices/system/node copy or YAML
+    # },
+    # A topology file (relative to this script) gives real NUMA nodes, SMT
+    # siblings and per-NUMA memory; its CPU count replaces "cores". YAML form:
+    #   numa_nodes:
+    #     - {cpus: "0-7,16-23", memory: 65536}
+    #     - {cpus: "8-15,24-31", memory: 65536}
+    #   smt_siblings: ["0,16", "1,17", ...]
+}
+
+# =============================================================================
+
+# ANSI colors
+class Colors:
+    RED = '\033[91m'
+    GREEN = '\033[92m'
+    YELLOW = '\033[93m'
+    BLUE = '\033[94m'
+    MAGENTA = '\033[95m'
+    CYAN = '\033[96m'
+    WHITE = '\033[97m'
+    BOLD = '\033[1m'
+    RESET = '\033[0m'
+
+@dataclass
+class VM:
+    """A Proxmox guest, QEMU VM or LXC container, in the units Proxmox allocates."""
+    name: str
+    host_node: str
+    role: str  # "master", "worker" or "lxc"
+    ip: str
+    cpu: int
+    cpu_affinity: str
+    numa: bool
+    ram_dedicated: int  # MB
+    disk_size: int  # GB
+    bandwidth_limit: int
+    datastore_id: str
+    workload: Optional[str] = None
+    additional_disks: Dict[str, dict] = field(default_factory=dict)  # name -> size, datastore_id, filesystem
+    stack: str = ""  # directory the VM is defined in
+    kubelet_args: Dict[str, str] = field(default_factory=dict)  # effective kubelet_extraArgs (workers)
+    sysctls: Dict[str, str] = field(default_factory=dict)  # effective sysctls (workers)
+    bridge: str = "vmbr0"  # bridge of the guest NIC; the modules always use vmbr0
+    kind: str = "qemu"  # "qemu" VM or "lxc" container
+    ip_ref: str = ""  # expression ip was given as (e.g. local.master_ips[0]), resolved per stack
+
+    @property
+    def pinnable(self) -> bool:
+        """Whether the guest takes cpu_affinity/numa; the LXC module sets neither."""
+        return self.kind == "qemu"
+
+    @cached_property
+    def affinity_mask(self) -> int:
+        """cpu_affinity as a bitmask (bit n set = pinned to CPU n), parsed once."""
+        return parse_affinity(self.cpu_affinity)
+
+# =============================================================================
+# CPU AFFINITY BITMASKS
+# =============================================================================
+
+def parse_affinity(affinity: str) -> int:
+    """Parse CPU affinity string like '0-1' or '0,2,4' into a CPU bitmask; '5-2' reads as '2-5'."""
+    mask = 0
+    if not affinity:
+        return mask
+
+    for part in affinity.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = sorted(int(x) for x in part.split('-'))
+            mask |= ((1 << (end - start + 1)) - 1) << start
+        elif part:
+            mask |= 1 << int(part)
+    return mask
+
+def cpu_mask(count: int, first: int = 0) -> int:
+    """Mask of `count` consecutive CPUs starting at `first`."""
+    return ((1 << count) - 1) << first
+
+def mask_ranges(mask: int) -> List[Tuple[int, int]]:
+    """Split a mask into inclusive (start, end) runs of set bits, one step per run."""
+    ranges = []
+    while mask:
+        start = (mask & -mask).bit_length() - 1
+        shifted = mask >> start
+        length = (shifted ^ (shifted + 1)).bit_length() - 1
+        ranges.append((start, start + length - 1))
+        mask &= ~cpu_mask(length, start)
+    return ranges
+
+def format_ranges(mask: int) -> str:
+    """Format a mask as a cpu_affinity-style list, e.g. '0-5, 8'."""
+    return ", ".join(f"{s}-{e}" if s != e else str(s) for s, e in mask_ranges(mask))
+
+def overlap_mask(masks) -> Tuple[int, int]:
+    """Return (used, overlapping) masks for a sequence of affinity masks."""
+    used = overlap = 0
+    for mask in masks:
+        overlap |= used & mask
+        used |= mask
+    return used, overlap
+
+# =============================================================================
+# NODE TOPOLOGY
+# =============================================================================
+
+@dataclass
+class Topology:
+    """NUMA and SMT layout of a host."""
+    numa_cpus: List[int]  # CPU mask per NUMA node
+    numa_memory: List[int]  # MB per NUMA node
+    siblings: List[int] = field(default_factory=list)  # CPU mask per physical core with SMT
+
+    @property
+    def cpu_count(self) -> int:
+        return sum(mask.bit_count() for mask in self.numa_cpus)
+
+    def nodes_of(self, mask: int) -> List[int]:
+        """NUMA node numbers a CPU mask touches."""
+        return [n for n, cpus in enumerate(self.numa_cpus) if cpus & mask]
+
+# Topologies loaded from dumps, by host; other hosts get one from NODES
+_TOPOLOGIES: Dict[str, Topology] = {}
+
+def _split_memory(memory: int, count: int) -> List[int]:
+    return [memory // count] * count
+
+def _parse_lscpu(text: str, memory: int) -> Topology:
+    """Parse `lscpu -p` output (CPU,Core,Socket,Node,... columns)."""
+    columns = ["CPU", "Core", "Socket", "Node"]
+    nodes: Dict[int, int] = defaultdict(int)
+    cores: Dict[Tuple[int, int], int] = defaultdict(int)
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#"):
+            if "CPU," in line:
+                columns = [c.strip() for c in line.lstrip("# ").split(",")]
+            continue
+        if not line:
+            continue
+        row = dict(zip(columns, line.split(",")))
+        cpu = int(row["CPU"])
+        socket = int(row.get("Socket") or 0)
+        node = int(row["Node"]) if row.get("Node") else socket
+        nodes[node] |= 1 << cpu
+        cores[(socket, int(row.get("Core") or cpu))] |= 1 << cpu
+    if not nodes:
+        raise ValueError("no CPU rows found in lscpu -p output")
+    numa_cpus = [nodes[n] for n in sorted(nodes)]
+    siblings = [mask for mask in cores.values() if mask.bit_count() > 1]
+    return Topology(numa_cpus, _split_memory(memory, len(numa_cpus)), siblings)
+
+def _parse_sysfs(path: Path, memory: int) -> Topology:
+    """Parse a copy of /sys/devices/system/node (node*/cpulist, node*/meminfo).
+
+    SMT siblings are read from cpu*/topology/thread_siblings_list in a copy of
+    /sys/devices/system/cpu next to it or inside it, if present.
+    """
+    node_dirs = sorted(path.glob("node[0-9]*"), key=lambda p: int(p.name[4:]))
+    if not node_dirs:
+        raise ValueError(f"no node*/ directories in '{path}'")
+    numa_cpus, numa_memory = [], []
+    for node_dir in node_dirs:
+        numa_cpus.append(parse_affinity((node_dir / "cpulist").read_text().strip()))
+        meminfo = node_dir / "meminfo"
+        total = re.search(r'MemTotal:\s*(\d+)\s*kB', meminfo.read_text()) if meminfo.exists() else None
+        numa_memory.append(int(total.group(1)) // 1024 if total else 0)
+    if not all(numa_memory):
+        numa_memory = _split_memory(memory, len(numa_cpus))
+
+    siblings = set()
+    for cpu_dir in (path / "cpu", path.parent / "cpu"):
+        for sibling_file in cpu_dir.glob("cpu[0-9]*/topology/thread_siblings_list"):
+            mask = parse_affinity(sibling_file.read_text().strip())
+            if mask.bit_count() > 1:
+                siblings.add(mask)
+    return Topology(numa_cpus, numa_memory, sorted(siblings))
+
+def _parse_structured(data: dict, memory: int) -> Topology:
+    """Parse a YAML/JSON topology: numa_nodes: [{cpus, memory}], smt_siblings: [cpulist]."""
+    nodes = data.get("numa_nodes") or []
+    if not nodes:
+        raise ValueError("topology has no numa_nodes")
+    numa_cpus = [parse_affinity(str(node["cpus"])) for node in nodes]
+    numa_memory = [int(node.get("memory", 0)) for node in nodes]
+    if not all(numa_memory):
+        numa_memory = _split_memory(memory, len(numa_cpus))
+    siblings = [parse_affinity(str(s)) for s in data.get("smt_siblings") or []]
+    return Topology(numa_cpus, numa_memory, [s for s in siblings if s.bit_count() > 1])
+
+def load_topology(path: Path, memory: int) -> Topology:
+    """Load a host topology from an lscpu -p dump, a sysfs node/ copy, or a YAML/JSON file.
+
+    memory (MB) is split evenly across NUMA nodes when the dump has no per-node memory.
+    """
+    if path.is_dir():
+        return _parse_sysfs(path, memory)
+    text = path.read_text()
+    if path.suffix == ".json":
+        import json
+        return _parse_structured(json.loads(text), memory)
+    if path.suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"PyYAML is required to read '{path}' (pip install pyyaml)")
+        return _parse_structured(yaml.safe_load(text) or {}, memory)
+    return _parse_lscpu(text, memory)
+
+def register_topology(host: str, topology: Topology):
+    """Use topology for host, making its logical CPU count the host's CPU capacity."""
+    _TOPOLOGIES[host] = topology
+    NODES.setdefault(host, {"sockets": 1, "memory": sum(topology.numa_memory)})["cores"] = topology.cpu_count
+
+def load_node_topologies(overrides: Dict[str, str]):
+    """Load the "topology" files named in NODES, with overrides (host -> path) taking precedence."""
+    script_dir = Path(__file__).resolve().parent
+    paths = {host: script_dir / config["topology"] for host, config in NODES.items() if config.get("topology")}
+    paths.update((host, Path(path)) for host, path in overrides.items())
+    for host, path in paths.items():
+        try:
+            topology = load_topology(path, node_config_for(host)["memory"])
+        except (OSError, ValueError, KeyError) as e:
+            raise ValueError(f"cannot load topology for '{host}' from '{path}': {e}")
+        register_topology(host, topology)
+
+def node_topology(host: str) -> Topology:
+    """Topology of host; without a loaded dump, one NUMA node per socket with cores split evenly."""
+    if host in _TOPOLOGIES:
+        return _TOPOLOGIES[host]
+    node_config = node_config_for(host)
+    host_cpus = node_config["cores"]
+    sockets = max(1, node_config.get("sockets", 1))
+    per_socket = host_cpus // sockets
+    domains = [cpu_mask(per_socket, s * per_socket) for s in range(sockets)]
+    domains[-1] |= cpu_mask(host_cpus) & ~cpu_mask(per_socket * sockets)
+    return Topology(domains, _split_memory(node_config["memory"], sockets))
+
+# =============================================================================
+# PROFILING
+# =============================================================================
+
+@dataclass
+class PhaseStats:
+    calls: int = 0
+    seconds: float = 0.0
+    allocated: int = 0  # bytes allocated and still alive when the phase ended
+    peak: int = 0       # highest traced memory above the level the phase started at
+
+class Profiler:
+    """Per-phase wall time and allocations plus named counters; a no-op until started.
+
+    Phases are flat: entering one resets the tracemalloc peak, so they must not nest.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.phases: Dict[str, PhaseStats] = {}
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    def start(self):
+        import tracemalloc
+        self.enabled = True
+        tracemalloc.start()
+
+    def stop(self):
+        import tracemalloc
+        self.enabled = False
+        tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        import tracemalloc
+        stats = self.phases.setdefault(name, PhaseStats())
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.seconds += time.perf_counter() - started
+            current, peak = tracemalloc.get_traced_memory()
+            stats.calls += 1
+            stats.allocated += current - before
+            stats.peak = max(stats.peak, peak - before)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.counters[name] += n
+
+PROFILE = Profiler()
+
+def print_profile(profiler: Profiler, out: TextIO):
+    """Print the phase table and counters collected by profiler."""
+    total = sum(stats.seconds for stats in profiler.phases.values())
+    print(f"\n{Colors.BOLD}Profile{Colors.RESET} (allocation tracing inflates wall times)\n", file=out)
+    print(f"  {'Phase':<24} {'Calls':>6} {'Time':>10} {'Share':>6} {'Allocated':>10} {'Peak':>10}", file=out)
+    print(f"  {'-'*24} {'-'*6} {'-'*10} {'-'*6} {'-'*10} {'-'*10}", file=out)
+    for name, stats in profiler.phases.items():
+        share = stats.seconds / total if total else 0.0
+        print(f"  {name:<24} {stats.calls:>6} {stats.seconds * 1000:>8.1f}ms {share:>6.0%} "
+              f"{stats.allocated / 1024:>8.0f}KB {stats.peak / 1024:>8.0f}KB", file=out)
+    print(f"  {'total':<24} {'':>6} {total * 1000:>8.1f}ms", file=out)
+    if profiler.counters:
+        print(f"\n  {'Counter':<24} {'Value':>12}", file=out)
+        print(f"  {'-'*24} {'-'*12}", file=out)
+        for name, value in profiler.counters.items():
+            print(f"  {name:<24} {value:>12,}", file=out)
+    print(file=out)
+
+# =============================================================================
+# HCL PARSING
+# =============================================================================
+
+class HclSyntaxError(ValueError):
+    """Raised when a .tf file cannot be tokenized or parsed."""
+
+    def __init__(self, message: str, source: str = "<string>", line: int = 0):
+        # Keep all constructor arguments in args so the error pickles across processes
+        super().__init__(message, source, line)
+        self.message = message
+        self.source = source
+        self.line = line
+
+    def __str__(self) -> str:
+        return f"{self.source}:{self.line}: {self.message}"
+
+    @classmethod
+    def at(cls, message: str, text: str, pos: int, source: str = "<string>") -> "HclSyntaxError":
+        return cls(message, source, text.count('\n', 0, pos) + 1)
+
+@dataclass
+class HclExpr:
+    """An HCL expression that is not a plain literal (e.g. local.master_ips[0])."""
+    text: str
+
+@dataclass
+class HclBlock:
+    """A block (module "x" { ... }) or object literal (key = { ... }) in the HCL tree."""
+    type: str
+    labels: List[str] = field(default_factory=list)
+    attributes: Dict[str, object] = field(default_factory=dict)
+    blocks: List["HclBlock"] = field(default_factory=list)
+
+# Token kinds: 'nl', 'string', 'heredoc', 'template', 'number', 'ident', 'op', 'eof'
+_TOKEN_RE = re.compile(r'''
+      (?P<ws>[ \t\r]+)
+    | (?P<nl>\n)
+    | (?P<comment>\#[^\n]*|//[^\n]*)
+    | (?P<block_comment>/\*)
+    | (?P<heredoc><<-?([A-Za-z_][A-Za-z0-9_]*)[ \t]*\r?\n)
+    | (?P<string>")
+    | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_\-]*)
+    | (?P<op>=>|==|!=|>=|<=|&&|\|\||\.\.\.|.)
+''', re.VERBOSE | re.DOTALL)
+
+# Strings without ${...} / %{...} templates take this fast path
+_SIMPLE_STRING_RE = re.compile(r'"((?:[^"\\$%\n]|\\.|[$%](?!\{))*)"')
+
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\'}
+# Backslash escapes, \uNNNN / \UNNNNNNNN code points, and the $${ / %%{ template escapes
+_ESCAPE_RE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)|([$%])\2(?=\{)')
+_TEMPLATE_ESCAPE_RE = re.compile(r'([$%])\1(?=\{)')
+# A ${ interpolation or %{ directive that is not escaped
+_TEMPLATE_RE = re.compile(r'(?<!\$)\$\{|(?<!%)%\{')
+
+def _unescape_match(m: "re.Match") -> str:
+    escape, marker = m.group(1), m.group(2)
+    if marker:
+        return marker
+    if len(escape) > 1:
+        code = int(escape[1:], 16)
+        return chr(code) if code <= 0x10FFFF else m.group(0)
+    return _ESCAPES.get(escape, m.group(0))
+
+def _unescape(raw: str) -> str:
+    if '\\' not in raw and '$$' not in raw and '%%' not in raw:
+        return raw
+    return _ESCAPE_RE.sub(_unescape_match, raw)
+
+def _scan_string(text: str, pos: int, source: str) -> int:
+    """Return the index just past the string opening at pos, skipping over templates."""
+    i = pos + 1
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == '\\':
+            i += 2
+        elif c == '"':
+            return i + 1
+        elif c == '\n':
+            break
+        elif c in '$%' and text.startswith('{', i + 1):
+            i = _scan_template(text, i + 2, source)
+        elif c in '$%' and text.startswith(c, i + 1):
+            i += 2  # $${ and %%{ escapes
+        else:
+            i += 1
+    raise HclSyntaxError.at("unterminated string", text, pos, source)
+
+def _scan_template(text: str, pos: int, source: str) -> int:
+    """Return the index just past the '}' closing a ${ or %{ template at pos."""
+    depth = 1
+    i = pos
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == '"':
+            i = _scan_string(text, i, source)
+            continue
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    raise HclSyntaxError.at("unterminated template interpolation", text, pos, source)
+
+def tokenize_hcl(text: str, source: str = "<string>") -> Iterator[Tuple[str, object, int, int]]:
+    """Tokenize HCL in a single pass, yielding (kind, value, start, end).
+
+    Comments (#, //, /* */) and whitespace are dropped; strings and heredocs
+    are yielded with their decoded contents, except that ones interpolating
+    ${...} or %{...} come back as 'template' tokens holding their source text.
+    """
+    match_token = _TOKEN_RE.match
+    match_string = _SIMPLE_STRING_RE.match
+    pos = 0
+    n = len(text)
+    matches = 0  # regex invocations, reported once at the end
+    while pos < n:
+        m = match_token(text, pos)
+        matches += 1
+        kind = m.lastgroup
+        end = m.end()
+        if kind == 'ws' or kind == 'comment':
+            pass
+        elif kind == 'nl':
+            yield ('nl', '\n', pos, end)
+        elif kind == 'block_comment':
+            close = text.find('*/', end)
+            if close < 0:
+                raise HclSyntaxError.at("unterminated block comment", text, pos, source)
+            end = close + 2
+        elif kind == 'string':
+            sm = match_string(text, pos)
+            matches += 1
+            if sm:
+                end = sm.end()
+                yield ('string', _unescape(sm.group(1)), pos, end)
+            else:
+                end = _scan_string(text, pos, source)
+                raw = text[pos + 1:end - 1]
+                if _TEMPLATE_RE.search(raw):
+                    yield ('template', text[pos:end], pos, end)
+                else:
+                    yield ('string', _unescape(raw), pos, end)
+        elif kind == 'heredoc':
+            marker = m.group(6)
+            term = re.compile(rf'^[ \t]*{marker}[ \t]*\r?$', re.MULTILINE).search(text, end)
+            if not term:
+                raise HclSyntaxError.at(f"unterminated heredoc <<{marker}", text, pos, source)
+            body = text[end:term.start()]
+            if m.group().startswith('<<-'):
+                # Indented heredocs lose the common leading whitespace, as in Terraform
+                body = textwrap.dedent(body)
+            end = term.end()
+            if _TEMPLATE_RE.search(body):
+                yield ('template', text[pos:end], pos, end)
+            else:
+                # Heredocs take no backslash escapes, only $${ and %%{
+                yield ('heredoc', _TEMPLATE_ESCAPE_RE.sub(r'\1', body), pos, end)
+        elif kind == 'number':
+            raw = m.group()
+            yield ('number', float(raw) if ('.' in raw or 'e' in raw or 'E' in raw) else int(raw), pos, end)
+        else:
+            yield (kind, m.group(), pos, end)
+        pos = end
+    PROFILE.count("regex_invocations", matches)
+    yield ('eof', None, n, n)
+
+_LITERAL_IDENTS = {'true': True, 'false': False, 'null': None}
+_OPENERS = {'{': '}', '[': ']', '(': ')'}
+
+class _HclParser:
+    """Recursive-descent parser building an HclBlock tree from the token stream."""
+
+    def __init__(self, text: str, source: str):
+        self.text = text
+        self.source = source
+        self._tokens = tokenize_hcl(text, source)
+        self.tok = next(self._tokens)
+
+    def _advance(self):
+        self.tok = next(self._tokens)
+
+    def _error(self, message: str):
+        return HclSyntaxError.at(message, self.text, self.tok[2], self.source)
+
+    def _is_op(self, value: str) -> bool:
+        return self.tok[0] == 'op' and self.tok[1] == value
+
+    def _at_value_end(self) -> bool:
+        kind, value = self.tok[0], self.tok[1]
+        return kind in ('nl', 'eof') or (kind == 'op' and value in (',', '}', ']', ')'))
+
+    def _skip_newlines(self):
+        while self.tok[0] == 'nl':
+            self._advance()
+
+    def parse(self) -> HclBlock:
+        root = HclBlock(type="")
+        self._parse_body(root, closer=None)
+        return root
+
+    def _parse_body(self, block: HclBlock, closer: Optional[str]):
+        while True:
+            while self.tok[0] == 'nl' or self._is_op(','):
+                self._advance()
+            kind, value = self.tok[0], self.tok[1]
+            if kind == 'eof':
+                if closer:
+                    raise self._error(f"expected '{closer}' before end of file")
+                return
+            if kind == 'op' and value == closer:
+                self._advance()
+                return
+            if (kind == 'op' and value == '(') or kind in ('template', 'number'):
+                # Computed object keys, e.g. (var.name) = 1, are kept by their source text
+                key = self._parse_key_expr()
+                if not (self._is_op('=') or self._is_op(':')):
+                    raise self._error(f"expected '=' after {key!r}")
+                self._advance()
+                block.attributes[key] = self._parse_value(key)
+                continue
+            if kind not in ('ident', 'string'):
+                raise self._error(f"unexpected {value!r}")
+            key = value
+            self._advance()
+            if self._is_op('=') or self._is_op(':'):
+                self._advance()
+                block.attributes[key] = self._parse_value(key)
+                continue
+            labels = []
+            while self.tok[0] in ('ident', 'string'):
+                labels.append(self.tok[1])
+                self._advance()
+            if not self._is_op('{'):
+                raise self._error(f"expected '=' or '{{' after {key!r}")
+            self._advance()
+            child = HclBlock(type=key, labels=labels)
+            self._parse_body(child, closer='}')
+            block.blocks.append(child)
+
+    def _parse_value(self, key: str) -> object:
+        kind, value, start, _ = self.tok
+        if kind == 'op' and value == '{':
+            self._advance()
+            self._skip_newlines()
+            if self.tok[0] == 'ident' and self.tok[1] == 'for':
+                return self._finish_expr(start, depth=1)
+            obj = HclBlock(type=key)
+            self._parse_body(obj, closer='}')
+            result = obj
+        elif kind == 'op' and value == '[':
+            self._advance()
+            self._skip_newlines()
+            if self.tok[0] == 'ident' and self.tok[1] == 'for':
+                return self._finish_expr(start, depth=1)
+            result = []
+            while True:
+                while self.tok[0] == 'nl' or self._is_op(','):
+                    self._advance()
+                if self._is_op(']'):
+                    self._advance()
+                    break
+                if self.tok[0] == 'eof':
+                    raise self._error("expected ']' before end of file")
+                result.append(self._parse_value(key))
+        elif kind in ('string', 'heredoc', 'number'):
+            self._advance()
+            result = value
+        elif kind == 'ident' and value in _LITERAL_IDENTS:
+            self._advance()
+            result = _LITERAL_IDENTS[value]
+        else:
+            return self._finish_expr(start, depth=0)
+        if self._at_value_end():
+            return result
+        # Literal followed by more tokens (e.g. "a" == x, [..][0]) is an expression
+        return self._finish_expr(start, depth=0)
+
+    def _parse_key_expr(self) -> str:
+        """Consume a parenthesized, template or numeric object key and return its source text."""
+        kind, _, start, end = self.tok
+        self._advance()
+        if kind == 'op':
+            depth = 1
+            while depth:
+                kind, value, _, end = self.tok
+                if kind == 'eof':
+                    raise self._error("expected ')' before end of file")
+                if kind == 'op' and value in _OPENERS:
+                    depth += 1
+                elif kind == 'op' and value in ('}', ']', ')'):
+                    depth -= 1
+                self._advance()
+        return self.text[start:end]
+
+    def _finish_expr(self, start: int, depth: int) -> HclExpr:
+        """Consume tokens up to the end of the current expression."""
+        end = start
+        while True:
+            kind, value, _, tok_end = self.tok
+            if kind == 'eof':
+                if depth:
+                    raise self._error("unbalanced brackets in expression")
+                break
+            if depth == 0 and self._at_value_end():
+                break
+            if kind == 'op':
+                if value in _OPENERS:
+                    depth += 1
+                elif value in ('}', ']', ')'):
+                    depth -= 1
+            end = tok_end
+            self._advance()
+        PROFILE.count("brace_walk_chars", end - start)
+        return HclExpr(self.text[start:end].strip())
+
+def parse_hcl(text: str, source: str = "<string>") -> HclBlock:
+    """Parse HCL text into a tree of HclBlock nodes."""
+    return _HclParser(text, source).parse()
+
+def find_attributes(block: HclBlock, name: str) -> Iterator[HclBlock]:
+    """Yield every object-valued attribute called `name`, in document order."""
+    for key, value in block.attributes.items():
+        if isinstance(value, HclBlock):
+            if key == name:
+                yield value
+            else:
+                yield from find_attributes(value, name)
+    for child in block.blocks:
+        yield from find_attributes(child, name)
+
+def _as_str(value: object) -> str:
+    return value if isinstance(value, str) else ""
+
+def _as_int(value: object) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    return int(value)
+
+def _as_float(value: object, default: float = 0.0) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return default
+    return float(value)
+
+def _as_bool(value: object) -> bool:
+    return value if isinstance(value, bool) else False
+
+def _as_ref(value: object) -> str:
+    return value.text if isinstance(value, HclExpr) else ""
+
+# Map locals the address plan reads, and the only keys of each that are kept;
+# anything else in them (passwords, tokens, ...) never reaches the parse cache
+PLAN_LOCALS = {
+    "network": ("gateway", "cidr", "reserved"),
+    "proxmox": ("endpoint",),
+    "cluster_config": ("podSubnets", "serviceSubnets"),
+}
+
+def hcl_literal(value: object) -> object:
+    """An attribute value as plain JSON-able data; expressions become None."""
+    if isinstance(value, HclBlock):
+        return {key: hcl_literal(v) for key, v in value.attributes.items()}
+    if isinstance(value, list):
+        return [hcl_literal(v) for v in value]
+    return None if isinstance(value, HclExpr) else value
+
+def _is_address_literal(value: object) -> bool:
+    """An IP address, or a list/map holding addresses and nothing but unresolved expressions besides."""
+    if isinstance(value, str):
+        return parse_address(value) is not None
+    items = value.values() if isinstance(value, dict) else value if isinstance(value, list) else None
+    if not items:
+        return False
+    items = [v for v in items if v is not None]
+    return bool(items) and all(isinstance(v, str) and parse_address(v) is not None for v in items)
+
+def extract_locals(tree: HclBlock) -> Dict[str, object]:
+    """The literal locals address plans and local.* IP references need.
+
+    Only the PLAN_LOCALS keys and locals holding IP addresses (master_endpoint,
+    master_ips, ...) are kept; every other local is dropped.
+    """
+    values = {}
+    for block in tree.blocks:
+        if block.type != "locals":
+            continue
+        for key, v in block.attributes.items():
+            value = hcl_literal(v)
+            if key in PLAN_LOCALS:
+                if isinstance(value, dict):
+                    values[key] = {k: value[k] for k in PLAN_LOCALS[key] if k in value}
+            elif _is_address_literal(value):
+                values[key] = value
+    return values
+
+def _flag_value(value: object) -> str:
+    """A flag value as written on a command line (true, not True)."""
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+def _as_flags(value: object) -> Dict[str, str]:
+    """A map of command-line flags (kubelet_extraArgs, sysctls) as strings."""
+    if not isinstance(value, HclBlock):
+        return {}
+    return {key: _flag_value(v) for key, v in value.attributes.items() if isinstance(v, (str, int, float))}
+
+# Attribute holding host_node -> vm_name -> config maps, and the role of its VMs
+VM_BLOCKS = {
+    "master_vms": "master",
+    "worker_vms": "worker",
+    "lxc_containers": "lxc",
+}
+
+def extract_container(name: str, host_node: str, attrs: Dict[str, object]) -> VM:
+    """An lxc_containers entry, normalized as the LXC module does.
+
+    cpu may be fractional and ram_dedicated is in (fractional) GB; Proxmox
+    gets ceil(cpu) cores and ceil(ram_dedicated * 1024) MB.
+    """
+    return VM(
+        name=name,
+        host_node=host_node,
+        role="lxc",
+        ip=_as_str(attrs.get("ip")),
+        ip_ref=_as_ref(attrs.get("ip")),
+        cpu=math.ceil(_as_float(attrs.get("cpu"), 1)),
+        cpu_affinity="",
+        numa=False,
+        ram_dedicated=math.ceil(_as_float(attrs.get("ram_dedicated"), 1) * 1024),
+        disk_size=_as_int(attrs.get("disk_size", 8)),
+        bandwidth_limit=_as_int(attrs.get("bandwidth_limit")),
+        datastore_id=_as_str(attrs.get("datastore_id")),
+        kind="lxc",
+    )
+
+def extract_vms_from_block(host_block: HclBlock, host_node: str, role: str) -> List[VM]:
+    """Extract VM definitions from a host block (vm_name -> config)."""
+    vms = []
+
+    for vm_name, vm_block in host_block.attributes.items():
+        if not isinstance(vm_block, HclBlock):
+            continue
+        attrs = vm_block.attributes
+        if role == "lxc":
+            vms.append(extract_container(vm_name, host_node, attrs))
+            continue
+
+        vm = VM(
+            name=vm_name,
+            host_node=host_node,
+            role=role,
+            ip=_as_str(attrs.get("ip")),
+            ip_ref=_as_ref(attrs.get("ip")),
+            cpu=_as_int(attrs.get("cpu")),
+            cpu_affinity=_as_str(attrs.get("cpu_affinity")),
+            numa=_as_bool(attrs.get("numa")),
+            ram_dedicated=_as_int(attrs.get("ram_dedicated")),
+            disk_size=_as_int(attrs.get("disk_size")),
+            bandwidth_limit=_as_int(attrs.get("bandwidth_limit")),
+            datastore_id=_as_str(attrs.get("datastore_id")),
+            workload=_as_str(attrs.get("workload")) or None,
+            kubelet_args=_as_flags(attrs.get("kubelet_extraArgs")),
+            sysctls=_as_flags(attrs.get("sysctls")),
+        )
+
+        # Extract additional disks; each may live on its own datastore
+        disks = attrs.get("additional_disks")
+        if isinstance(disks, HclBlock):
+            for disk_name, disk_block in disks.attributes.items():
+                if isinstance(disk_block, HclBlock):
+                    vm.additional_disks[disk_name] = {
+                        'size': _as_int(disk_block.attributes.get("size")),
+                        'datastore_id': _as_str(disk_block.attributes.get("datastore_id")) or vm.datastore_id,
+                        'filesystem': _as_str(disk_block.attributes.get("filesystem")) or "xfs",
+                    }
+
+        vms.append(vm)
+
+    return vms
+
+def _worker_layers(tree: HclBlock, name: str) -> Tuple[Dict[str, str], Dict[str, Dict[str, str]]]:
+    """A flag map (kubelet_extraArgs, sysctls) from worker_config and from each worker_config_workload tier."""
+    base = next(find_attributes(tree, "worker_config"), None)
+    tiers = next(find_attributes(tree, "worker_config_workload"), None)
+    return (_as_flags(base.attributes.get(name)) if base else {},
+            {tier: _as_flags(block.attributes.get(name))
+             for tier, block in (tiers.attributes.items() if tiers else ())
+             if isinstance(block, HclBlock)})
+
+def extract_vms_from_tree(tree: HclBlock) -> List[VM]:
+    """Extract all VMs from a parsed .tf file."""
+    vms = []
+    for block_name, role in VM_BLOCKS.items():
+        for vms_block in find_attributes(tree, block_name):
+            # First level keys are host nodes
+            for host_node, host_block in vms_block.attributes.items():
+                if isinstance(host_block, HclBlock):
+                    vms.extend(extract_vms_from_block(host_block, host_node, role))
+
+    # Effective kubelet flags and sysctls as the worker module merges them: global -> workload -> VM
+    workers = [vm for vm in vms if vm.role == "worker"]
+    if workers:
+        base, tiers = _worker_layers(tree, "kubelet_extraArgs")
+        base_sysctls, tier_sysctls = _worker_layers(tree, "sysctls")
+        for vm in workers:
+            vm.kubelet_args = {**base, **tiers.get(vm.workload, {}), **vm.kubelet_args}
+            vm.sysctls = {**base_sysctls, **tier_sysctls.get(vm.workload, {}), **vm.sysctls}
+    return vms
+
+@dataclass
+class ParsedFile:
+    """What one .tf file contributes to its stack."""
+    vms: List[VM]
+    locals: Dict[str, object] = field(default_factory=dict)  # literal locals, for local.* references
+    error: Optional[HclSyntaxError] = None  # why the file contributes nothing
+
+def parse_tf_source(tf_file: Path, content: Optional[str] = None) -> ParsedFile:
+    """Parse a single .tf file into its VM definitions and literal locals."""
+    if content is None:
+        with PROFILE.phase("read"):
+            content = tf_file.read_text()
+    PROFILE.count("bytes_scanned", len(content))
+    with PROFILE.phase("parse.blocks"):
+        tree = parse_hcl(content, source=str(tf_file))
+    with PROFILE.phase("parse.vms"):
+        vms = extract_vms_from_tree(tree)
+        values = extract_locals(tree)
+    PROFILE.count("vms_parsed", len(vms))
+    return ParsedFile(vms, values)
+
+def parse_tf_files(directory: Path, cache: Optional["ParseCache"] = None) -> List[VM]:
+    """Parse all .tf files in directory and extract VM definitions."""
+    return scan_stacks([directory], cache=cache).vms
+
+# =============================================================================
+# MULTI-STACK SCANNING
+# =============================================================================
+
+# Directories never containing stacks of our own (provider/module caches, VCS)
+SKIP_DIRS = {".terraform", ".git"}
+
+# Below this many files to parse, process start-up costs more than it saves
+PARALLEL_MIN_FILES = 8
+
+@dataclass
+class Fleet:
+    """VMs from every scanned stack (a directory of .tf files), grouped by stack."""
+    stacks: Dict[str, List[VM]] = field(default_factory=dict)
+    plans: "AddressPlans" = field(default_factory=lambda: AddressPlans())
+    errors: List["Finding"] = field(default_factory=list)  # one per .tf file that failed to parse
+
+    @property
+    def vms(self) -> List[VM]:
+        return [vm for stack_vms in self.stacks.values() for vm in stack_vms]
+
+    def stack_counts(self) -> Dict[str, int]:
+        return {name: len(stack_vms) for name, stack_vms in self.stacks.items()}
+
+def find_tf_files(root: Path, recursive: bool = False) -> List[Path]:
+    """List the .tf files under root, descending into subdirectories if recursive."""
+    if not recursive:
+        return sorted(root.glob("*.tf"))
+
+    tf_files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+        tf_files.extend(Path(dirpath) / name for name in sorted(filenames) if name.endswith(".tf"))
+    return tf_files
+
+def stack_name(tf_file: Path, root: Path) -> str:
+    """Name a stack by its directory relative to the scan root."""
+    rel = tf_file.parent.relative_to(root)
+    return rel.as_posix() if rel.parts else root.resolve().name
+
+def stack_names(file_roots: Dict[Path, Path]) -> Dict[Path, str]:
+    """Name the stack of every directory in file_roots.
+
+    Directories whose stack_name collides with another directory's (prod/eu/k8s
+    and prod/us/k8s are both "k8s") are named by their path relative to the
+    common parent of the colliding directories instead ("eu/k8s", "us/k8s").
+    """
+    dirs: Dict[str, set] = {}
+    for tf_file, root in file_roots.items():
+        dirs.setdefault(stack_name(tf_file, root), set()).add(tf_file.parent.resolve())
+
+    names: Dict[Path, str] = {}
+    for name, stack_dirs in dirs.items():
+        if len(stack_dirs) == 1:
+            names[next(iter(stack_dirs))] = name
+            continue
+        parent = Path(os.path.commonpath(stack_dirs))
+        for stack_dir in stack_dirs:
+            names[stack_dir] = stack_dir.relative_to(parent).as_posix()
+    return names
+
+def _parse_file_job(path: str, hashed: bool = True) -> Tuple[str, int, int, str, List[dict], dict, Optional[HclSyntaxError]]:
+    """Process-pool worker: parse one file and return its VMs and locals with cache metadata.
+
+    Unless hashed, the content hash (only the parse cache needs it) is left
+    empty. A syntax error is returned rather than raised, so it only costs
+    that file.
+    """
+    tf_file = Path(path)
+    with PROFILE.phase("read"):
+        st = tf_file.stat()
+        data = tf_file.read_bytes()
+        content = data.decode()
+        digest = ""
+        if hashed:
+            import hashlib
+            digest = hashlib.sha256(data).hexdigest()
+    try:
+        parsed = parse_tf_source(tf_file, content)
+    except HclSyntaxError as e:
+        return path, st.st_mtime_ns, st.st_size, digest, [], {}, e
+    return path, st.st_mtime_ns, st.st_size, digest, [asdict(vm) for vm in parsed.vms], parsed.locals, None
+
+def parse_files(tf_files: List[Path], cache: Optional["ParseCache"] = None, jobs: int = 1) -> Dict[Path, ParsedFile]:
+    """Parse tf_files, serving unchanged files from cache and the rest in parallel."""
+    results: Dict[Path, ParsedFile] = {}
+    pending = []
+    for tf_file in tf_files:
+        cached = cache.lookup(tf_file) if cache is not None else None
+        if cached is not None:
+            results[tf_file] = cached
+            PROFILE.count("cache_hits")
+        else:
+            if cache is not None:
+                PROFILE.count("cache_misses")
+            pending.append(tf_file)
+
+    if jobs > 1 and len(pending) >= PARALLEL_MIN_FILES:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunksize = max(1, len(pending) // (jobs * 4))
+            parsed = list(pool.map(_parse_file_job, [str(f) for f in pending], itertools.repeat(cache is not None),
+                                   chunksize=chunksize))
+    else:
+        parsed = [_parse_file_job(str(f), cache is not None) for f in pending]
+
+    for tf_file, (_, mtime_ns, size, digest, vm_dicts, values, error) in zip(pending, parsed):
+        results[tf_file] = ParsedFile([VM(**vm) for vm in vm_dicts], values, error)
+        if cache is not None and error is None:
+            cache.store(tf_file, mtime_ns, size, digest, vm_dicts, values)
+
+    if cache is not None:
+        cache.save()
+    return results
+
+def collect_tf_files(roots: List[Path], recursive: bool = False) -> Dict[Path, Path]:
+    """Map every .tf file under roots to the root it was first found under.
+
+    Roots and files are resolved first, so overlapping roots (a directory and
+    one of its stacks, "." and its absolute path) contribute each file once.
+    """
+    file_roots: Dict[Path, Path] = {}
+    seen = set()
+    for root in roots:
+        root = root.resolve()
+        for tf_file in find_tf_files(root, recursive):
+            real = tf_file.resolve()
+            if real not in seen:
+                seen.add(real)
+                file_roots[tf_file] = root
+    return file_roots
+
+def build_fleet(file_roots: Dict[Path, Path], parsed: Dict[Path, ParsedFile]) -> Fleet:
+    """Group parsed VMs by stack, tagging each VM with its stack name.
+
+    local.* IP references are resolved against the stack's locals, and each
+    stack's locals are kept in the fleet's address plans. A file that failed
+    to parse becomes a critical hcl_syntax finding in fleet.errors.
+    """
+    fleet = Fleet()
+    stack_locals: Dict[str, Dict[str, object]] = {}
+    stack_dirs: Dict[str, Path] = {}
+    names = stack_names(file_roots)
+    for tf_file, root in file_roots.items():
+        name = names[tf_file.parent.resolve()]
+        stack_vms = fleet.stacks.setdefault(name, [])
+        stack_dirs.setdefault(name, tf_file.parent)
+        result = parsed.get(tf_file)
+        if result is None:
+            continue
+        if result.error is not None:
+            e = result.error
+            fleet.errors.append(Finding("critical", f"{tf_file.relative_to(root).as_posix()}:{e.line}: {e.message}; "
+                                                    f"its VMs were not analyzed.", check="hcl_syntax"))
+            continue
+        stack_locals.setdefault(name, {}).update(result.locals)
+        for vm in result.vms:
+            vm.stack = name
+            stack_vms.append(vm)
+
+    for name, stack_vms in fleet.stacks.items():
+        values = stack_locals.get(name, {})
+        for vm in stack_vms:
+            if vm.ip_ref and not vm.ip:
+                resolved = resolve_local(vm.ip_ref, values)
+                if isinstance(resolved, str):
+                    vm.ip = resolved
+        fleet.plans.register(name, values, stack_dirs[name])
+    return fleet
+
+def scan_stacks(roots: List[Path], recursive: bool = False,
+                cache: Optional["ParseCache"] = None, jobs: int = 1) -> Fleet:
+    """Parse every stack under roots into one fleet."""
+    file_roots = collect_tf_files(roots, recursive)
+    parsed = parse_files(list(file_roots), cache=cache, jobs=jobs)
+    return build_fleet(file_roots, parsed)
+
+# =============================================================================
+# TERRAFORM JSON INPUT
+# =============================================================================
+
+# Runs of anything but brackets, with whole strings swallowed, so skipping
+# a subtree only steps through its brackets in Python
+_JSON_SKIP_RE = re.compile(r'(?:[^"\[\]{}]+|"(?:[^"\\]|\\.)*")*')
+_JSON_WS_RE = re.compile(r'[\s,:]*')
+
+class JsonStream:
+    """Pull reader over a JSON file that only holds the value being read in memory.
+
+    Containers are walked key by key / element by element; values are either
+    decoded (read_value) or skipped (skip_value) without being materialized.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 16):
+        import json
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next significant character, skipping whitespace and separators."""
+        while True:
+            self.pos = _JSON_WS_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("unexpected end of JSON input")
+
+    def _expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"expected '{char}' at offset {self.pos} of the JSON buffer")
+        self.pos += 1
+
+    def read_value(self) -> object:
+        """Decode the next value, reading more input until it is complete."""
+        import json
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill(size):
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """Skip the next value without decoding it."""
+        if self.peek() not in "[{":
+            self.read_value()
+            return
+        depth = 0
+        while True:
+            self.pos = _JSON_SKIP_RE.match(self.buf, self.pos).end()
+            if self.pos >= len(self.buf):
+                if not self._fill():
+                    raise ValueError("unexpected end of JSON input")
+                continue
+            if self.buf[self.pos] == '"':
+                # A string cut by the chunk boundary; the regex only swallows complete ones
+                self._skip_string()
+                continue
+            char = self.buf[self.pos]
+            self.pos += 1
+            depth += 1 if char in "[{" else -1
+            if depth == 0:
+                return
+
+    def _skip_string(self):
+        """Move past the string opening at pos, reading more input without rescanning what was seen."""
+        i = self.pos + 1
+        size = self.chunk_size
+        while True:
+            end = self.buf.find('"', i)
+            if end < 0:
+                # _fill drops everything before pos, so keep i relative to it
+                i = len(self.buf) - self.pos
+                if not self._fill(size):
+                    raise ValueError("unexpected end of JSON input")
+                size *= 2
+                continue
+            # The quote is escaped if an odd number of backslashes precede it
+            start = end
+            while self.buf[start - 1] == '\\':
+                start -= 1
+            if (end - start) % 2 == 0:
+                self.pos = end + 1
+                return
+            i = end + 1
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield the keys of the next object; the caller must consume each value."""
+        self._expect("{")
+        while self.peek() != "}":
+            key = self.read_value()
+            yield key
+        self.pos += 1
+
+    def iter_array(self) -> Iterator[None]:
+        """Yield once per element of the next array; the caller must consume each element."""
+        self._expect("[")
+        while self.peek() != "]":
+            yield None
+        self.pos += 1
+
+# Resource types read from the plan/state, and the module that sets each VM's role
+TF_VM_RESOURCES = {"proxmox_virtual_environment_vm", "proxmox_virtual_environment_container"}
+# Applied Talos machine config, keyed like the VM it configures
+TF_TALOS_CONFIG = "talos_machine_configuration_apply"
+TF_MODULE_ROLES = {
+    "module.talos_master": "master",
+    "module.talos_worker": "worker",
+    "module.nginx_lb": "lxc",
+}
+
+def _first(values: dict, key: str) -> dict:
+    """First element of a nested block list such as cpu = [{...}]."""
+    items = values.get(key) or [{}]
+    return items[0] or {}
+
+def _ip_of(values: dict) -> str:
+    ipv4 = _first(_first(_first(values, "initialization"), "ip_config"), "ipv4")
+    return (ipv4.get("address") or "").split("/")[0]
+
+def vm_from_resource(resource: dict) -> Optional[VM]:
+    """Map a proxmox VM or container resource from terraform show -json onto a VM."""
+    if resource.get("mode") != "managed" or resource.get("type") not in TF_VM_RESOURCES:
+        return None
+    values = resource.get("values") or {}
+    address = resource.get("address", "")
+    role = next((r for module, r in TF_MODULE_ROLES.items() if address.startswith(module + ".")), None)
+    is_container = resource["type"] == "proxmox_virtual_environment_container"
+    if role is None:
+        tags = values.get("tags") or []
+        role = "lxc" if is_container else "master" if "master" in tags else "worker" if "worker" in tags else "vm"
+
+    index = resource.get("index")
+    name = index if isinstance(index, str) else values.get("name") or _first(values, "initialization").get("hostname") or address
+
+    cpu = _first(values, "cpu")
+    disks = values.get("disk") or []
+    root = next((d for d in disks if d.get("interface") in (None, "scsi0", "rootfs")), disks[0] if disks else {})
+    network = _first(values, "network_interface" if is_container else "network_device")
+
+    vm = VM(
+        name=name,
+        host_node=values.get("node_name") or "",
+        role=role,
+        ip=_ip_of(values),
+        cpu=int(cpu.get("cores") or 0),
+        cpu_affinity=cpu.get("affinity") or "",
+        numa=bool(cpu.get("numa")),
+        ram_dedicated=int(_first(values, "memory").get("dedicated") or 0),
+        disk_size=int(root.get("size") or 0),
+        bandwidth_limit=int(network.get("rate_limit") or 0),
+        bridge=network.get("bridge") or "vmbr0",
+        datastore_id=root.get("datastore_id") or "",
+        kind="lxc" if is_container else "qemu",
+    )
+    if role == "worker":
+        # The worker module tags VMs ["talos", "worker", <cluster>, <workload>]
+        tags = values.get("tags") or []
+        vm.workload = tags[3] if len(tags) > 3 and tags[3] else None
+    for disk in disks:
+        if disk is not root:
+            disk_name = (disk.get("serial") or disk.get("interface") or "").lower()
+            vm.additional_disks[disk_name] = {'size': int(disk.get("size") or 0),
+                                              'datastore_id': disk.get("datastore_id") or vm.datastore_id,
+                                              'filesystem': ""}
+    return vm
+
+def _machine_config(resource: dict) -> Optional[dict]:
+    """The machine section of a talos_machine_configuration_apply resource's config_patches.
+
+    Returns None when the patches cannot be read (PyYAML missing, unknown in a plan).
+    """
+    patches = (resource.get("values") or {}).get("config_patches")
+    if not isinstance(patches, list):
+        return None
+    try:
+        import yaml
+    except ImportError:
+        return None
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    machine: dict = {}
+    for patch in patches:
+        try:
+            docs = list(yaml.load_all(patch, Loader=loader)) if isinstance(patch, str) else []
+        except yaml.YAMLError:
+            continue
+        for doc in docs:
+            if isinstance(doc, dict) and isinstance(doc.get("machine"), dict):
+                machine.update(doc["machine"])
+    return machine
+
+def _apply_machine_config(vm: VM, machine: dict):
+    """Fill a worker's workload, kubelet flags and sysctls from its applied machine config.
+
+    The worker module adds a register-with-taints flag for the workload tier on
+    top of the merged kubelet_extraArgs; it is dropped so both inputs agree.
+    """
+    labels = machine.get("nodeLabels") or {}
+    vm.workload = labels.get("workload") or vm.workload
+    kubelet_args = {key: _flag_value(v) for key, v in ((machine.get("kubelet") or {}).get("extraArgs") or {}).items()}
+    if vm.workload and kubelet_args.get("register-with-taints") == f"workload={vm.workload}:NoSchedule":
+        del kubelet_args["register-with-taints"]
+    vm.kubelet_args = kubelet_args
+    vm.sysctls = {key: _flag_value(v) for key, v in (machine.get("sysctls") or {}).items()}
+
+def _walk_module(stream: JsonStream, vms: List[VM]):
+    module_vms: Dict[str, VM] = {}
+    configs: Dict[str, dict] = {}
+    for key in stream.iter_object():
+        if key == "resources":
+            for _ in stream.iter_array():
+                resource = stream.read_value()
+                vm = vm_from_resource(resource)
+                if vm:
+                    vms.append(vm)
+                    module_vms[str(resource.get("index"))] = vm
+                elif resource.get("type") == TF_TALOS_CONFIG and resource.get("mode") == "managed":
+                    machine = _machine_config(resource)
+                    if machine is not None:
+                        configs[str(resource.get("index"))] = machine
+        elif key == "child_modules":
+            for _ in stream.iter_array():
+                _walk_module(stream, vms)
+        else:
+            stream.skip_value()
+    for index, machine in configs.items():
+        vm = module_vms.get(index)
+        if vm is not None and vm.role == "worker":
+            _apply_machine_config(vm, machine)
+
+def parse_tf_json(f: TextIO) -> List[VM]:
+    """Extract VMs from `terraform show -json` output (state or plan), streaming it.
+
+    State files are read from "values", plans from "planned_values"; every
+    other part of the document is skipped without being decoded.
+    """
+    vms: List[VM] = []
+    stream = JsonStream(f)
+    for key in stream.iter_object():
+        if key not in ("values", "planned_values"):
+            stream.skip_value()
+            continue
+        for inner in stream.iter_object():
+            if inner == "root_module":
+                _walk_module(stream, vms)
+            else:
+                stream.skip_value()
+    return vms
+
+def load_tf_json(paths: List[str]) -> Fleet:
+    """Read one or more terraform show -json files ("-" for stdin) into a fleet."""
+    fleet = Fleet()
+    for path in paths:
+        if path == "-":
+            name, vms = "stdin", parse_tf_json(sys.stdin)
+        else:
+            with open(path) as f:
+                vms = parse_tf_json(f)
+            name = Path(path).resolve().parent.name
+        for vm in vms:
+            vm.stack = name
+        fleet.stacks.setdefault(name, []).extend(vms)
+    return fleet
+
+# =============================================================================
+# PARSE CACHE
+# =============================================================================
+
+# Bump whenever parsing or the VM fields change, so stale entries are dropped
+CACHE_VERSION = 8
+CACHE_MAX_ENTRIES = 1024
+DEFAULT_CACHE_FILE = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "vm-analyzer" / "parse-cache.json"
+
+# Files modified this close to when they were cached may change again within
+# the same mtime tick, so their content hash is always re-checked
+_RACY_WINDOW_NS = 2_000_000_000
+
+class ParseCache:
+    """On-disk cache of parsed VMs per .tf file.
+
+    Entries are keyed by resolved path and validated by mtime/size; when those
+    differ the content hash decides whether the file must be re-parsed. The
+    least recently used entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, path: Path, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries: Dict[str, dict] = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        import json
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == CACHE_VERSION:
+            self.entries = data.get("entries", {})
+
+    def lookup(self, tf_file: Path) -> Optional[ParsedFile]:
+        """Return the cached parse of tf_file, or None if it must be re-parsed."""
+        key = str(tf_file.resolve())
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+
+        try:
+            st = tf_file.stat()
+        except OSError:
+            return None
+        if not entry["racy"] and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            entry["used"] = time.time_ns()
+            return ParsedFile([VM(**vm) for vm in entry["vms"]], entry["locals"])
+
+        import hashlib
+        try:
+            data = tf_file.read_bytes()
+        except OSError:
+            return None
+        if entry["sha256"] != hashlib.sha256(data).hexdigest():
+            return None
+        self.store(tf_file, st.st_mtime_ns, st.st_size, entry["sha256"], entry["vms"], entry["locals"])
+        return ParsedFile([VM(**vm) for vm in entry["vms"]], entry["locals"])
+
+    def store(self, tf_file: Path, mtime_ns: int, size: int, digest: str, vms: List[dict], values: dict):
+        """Record the parsed VMs (as dicts) and literal locals of tf_file."""
+        now_ns = time.time_ns()
+        self.entries[str(tf_file.resolve())] = {
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "racy": now_ns - mtime_ns < _RACY_WINDOW_NS,
+            "sha256": digest,
+            "used": now_ns,
+            "vms": vms,
+            "locals": values,
+        }
+        self.dirty = True
+
+    def save(self):
+        """Write the cache back to disk if it changed, evicting old entries."""
+        if not self.dirty:
+            return
+        if len(self.entries) > self.max_entries:
+            by_age = sorted(self.entries, key=lambda k: self.entries[k]["used"])
+            for key in by_age[:len(self.entries) - self.max_entries]:
+                del self.entries[key]
+
+        import json
+        data = json.dumps({"version": CACHE_VERSION, "entries": self.entries}, separators=(",", ":"))
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Warning: could not write parse cache '{self.path}': {e}", file=sys.stderr)
+            return
+        self.dirty = False
+
+# =============================================================================
+# ADDRESS PLAN
+# =============================================================================
+
+# Manifests, relative to a stack directory, declaring LoadBalancer pools and BGP peers
+LB_POOL_FILES = ("cilium/bgp-config.yaml",)
+
+_LOCAL_REF_RE = re.compile(r'local\.([A-Za-z_][\w-]*)((?:\.[A-Za-z_][\w-]*|\[\d+\])*)$')
+_LOCAL_STEP_RE = re.compile(r'\.([A-Za-z_][\w-]*)|\[(\d+)\]')
+
+def resolve_local(ref: str, values: Dict[str, object]) -> object:
+    """Value of a local.x.y[i] reference in a stack's literal locals, or None."""
+    m = _LOCAL_REF_RE.match(ref.strip())
+    if not m:
+        return None
+    value = values.get(m.group(1))
+    for key, index in _LOCAL_STEP_RE.findall(m.group(2)):
+        if key and isinstance(value, dict):
+            value = value.get(key)
+        elif index and isinstance(value, list) and int(index) < len(value):
+            value = value[int(index)]
+        else:
+            return None
+    return value
+
+def parse_address(text: str):
+    """An IP address, accepting Proxmox's address/prefix form; None if invalid."""
+    import ipaddress
+    text = text.strip()
+    try:
+        # ip_address() is several times faster than ip_interface() on plain addresses
+        return ipaddress.ip_interface(text).ip if "/" in text else ipaddress.ip_address(text)
+    except ValueError:
+        return None
+
+def parse_address_range(text: str):
+    """(first, last) of "a.b.c.d", "a.b.c.d/nn" or "first-last"; None if invalid."""
+    import ipaddress
+    try:
+        if "-" in text:
+            first, last = (ipaddress.ip_address(part.strip()) for part in text.split("-", 1))
+            return (first, last) if first.version == last.version and first <= last else None
+        net = ipaddress.ip_network(text.strip(), strict=False)
+        return net.network_address, net.broadcast_address
+    except ValueError:
+        return None
+
+def format_address_range(first, last) -> str:
+    import ipaddress
+    if first == last:
+        return str(first)
+    nets = list(ipaddress.summarize_address_range(first, last))
+    return str(nets[0]) if len(nets) == 1 else f"{first}-{last}"
+
+@dataclass
+class AddressRange:
+    """An inclusive block of addresses an address plan sets aside."""
+    first: object  # ipaddress.IPv4Address / IPv6Address
+    last: object
+    label: str  # e.g. "gateway", "LoadBalancer pool bgp-pool"
+    kind: str = "reserved"  # "reserved", "lb_pool" or "cluster" (pod/service CIDR)
+    owner: str = ""  # local.* reference of the guest allowed to hold it
+
+    def __str__(self) -> str:
+        return format_address_range(self.first, self.last)
+
+class IpIndex:
+    """Address ranges sorted by start, for interval lookups.
+
+    Alongside the starts it keeps the running maximum of range ends, so a
+    lookup bisects to the last range starting at or before the query and walks
+    back only while an earlier range can still reach it.
+    """
+
+    def __init__(self, ranges: List[AddressRange]):
+        self.ranges: Dict[int, List[AddressRange]] = defaultdict(list)
+        for r in sorted(ranges, key=lambda r: (r.first.version, r.first, r.last)):
+            self.ranges[r.first.version].append(r)
+        self._starts = {v: [r.first for r in rs] for v, rs in self.ranges.items()}
+        self._max_end = {v: list(itertools.accumulate((r.last for r in rs), max)) for v, rs in self.ranges.items()}
+
+    def overlapping(self, first, last=None) -> List[AddressRange]:
+        """Ranges sharing at least one address with first..last, in address order."""
+        last = first if last is None else last
+        ranges = self.ranges.get(first.version)
+        if not ranges:
+            return []
+        max_end = self._max_end[first.version]
+        i = bisect.bisect_right(self._starts[first.version], last)
+        hits = []
+        while i > 0 and max_end[i - 1] >= first:
+            i -= 1
+            if ranges[i].last >= first:
+                hits.append(ranges[i])
+        return hits[::-1]
+
+@dataclass
+class AddressPlan:
+    """Addressing one stack declares in its locals and LoadBalancer manifests."""
+    subnet: object = None  # ipaddress network of the guests, from local.network gateway/cidr
+    gateway: object = None
+    ranges: List[AddressRange] = field(default_factory=list)
+    notes: List[str] = field(default_factory=list)
+
+    @cached_property
+    def index(self) -> IpIndex:
+        return IpIndex(self.ranges)
+
+class AddressPlans:
+    """The address plans of one fleet's stacks.
+
+    Each stack's literal locals and directory are registered as it is scanned;
+    plans are built on first use so runs that never check IPs skip the manifests.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Tuple[Dict[str, object], Path]] = {}
+        self._plans: Dict[str, AddressPlan] = {}
+
+    def register(self, stack: str, values: Dict[str, object], stack_dir: Path):
+        self._sources[stack] = (values, stack_dir)
+        self._plans.pop(stack, None)
+
+    def get(self, stack: str) -> Optional[AddressPlan]:
+        if stack not in self._plans and stack in self._sources:
+            self._plans[stack] = build_address_plan(*self._sources[stack])
+        return self._plans.get(stack)
+
+def _add_range(plan: AddressPlan, text: object, label: str, kind: str = "reserved", owner: str = ""):
+    bounds = parse_address_range(text) if isinstance(text, str) else None
+    if bounds is None:
+        plan.notes.append(f"Ignoring {label}: invalid address or range {text!r}.")
+        return
+    plan.ranges.append(AddressRange(*bounds, label, kind, owner))
+
+def _load_lb_manifests(plan: AddressPlan, stack_dir: Path):
+    """Add the LoadBalancer pools and BGP peers declared under stack_dir."""
+    for rel in LB_POOL_FILES:
+        path = stack_dir / rel
+        if not path.is_file():
+            continue
+        try:
+            import yaml
+        except ImportError:
+            plan.notes.append(f"PyYAML is required to read '{rel}' (pip install pyyaml); LoadBalancer pools not checked.")
+            return
+        try:
+            # libyaml's loader, when PyYAML was built with it, parses several times faster
+            loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            docs = [doc for doc in yaml.load_all(path.read_text(), Loader=loader) if isinstance(doc, dict)]
+        except (OSError, yaml.YAMLError) as e:
+            plan.notes.append(f"Could not read '{rel}': {' '.join(str(e).split())}")
+            continue
+
+        for doc in docs:
+            kind, spec = doc.get("kind"), doc.get("spec") or {}
+            name = (doc.get("metadata") or {}).get("name", "?")
+            if kind == "CiliumLoadBalancerIPPool":
+                for block in spec.get("blocks") or spec.get("cidrs") or []:
+                    text = block.get("cidr") or f"{block.get('start')}-{block.get('stop') or block.get('start')}"
+                    _add_range(plan, text, f"LoadBalancer pool {name}", "lb_pool")
+            elif kind == "IPAddressPool":  # MetalLB
+                for text in spec.get("addresses") or []:
+                    _add_range(plan, text, f"LoadBalancer pool {name}", "lb_pool")
+            elif kind == "CiliumBGPClusterConfig":
+                for instance in spec.get("bgpInstances") or []:
+                    for peer in instance.get("peers") or []:
+                        if peer.get("peerAddress"):
+                            _add_range(plan, peer["peerAddress"], f"BGP peer {peer.get('name', '?')}")
+
+def build_address_plan(values: Dict[str, object], stack_dir: Path) -> AddressPlan:
+    """Collect a stack's subnet, reserved addresses and LoadBalancer pools.
+
+    Reads local.network (gateway, cidr, optional reserved list),
+    local.master_endpoint, local.proxmox.endpoint, the pod and service
+    subnets of local.cluster_config and the manifests in LB_POOL_FILES.
+    """
+    import ipaddress
+    plan = AddressPlan()
+    network = values.get("network") if isinstance(values.get("network"), dict) else {}
+    gateway = network.get("gateway")
+    if isinstance(gateway, str) and parse_address(gateway) is not None:
+        plan.gateway = parse_address(gateway)
+        prefix = network.get("cidr", 32 if plan.gateway.version == 4 else 128)
+        try:
+            plan.subnet = ipaddress.ip_network(f"{plan.gateway}/{prefix}", strict=False)
+        except ValueError:
+            plan.notes.append(f"Ignoring local.network.cidr: invalid prefix {prefix!r}.")
+        plan.ranges.append(AddressRange(plan.gateway, plan.gateway, "gateway"))
+    if plan.subnet is not None and plan.subnet.num_addresses > 2:
+        plan.ranges.append(AddressRange(plan.subnet.network_address, plan.subnet.network_address, "network address"))
+        plan.ranges.append(AddressRange(plan.subnet.broadcast_address, plan.subnet.broadcast_address, "broadcast address"))
+    for text in network.get("reserved") or []:
+        _add_range(plan, text, "local.network.reserved")
+
+    endpoint = values.get("master_endpoint")
+    if isinstance(endpoint, str):
+        _add_range(plan, endpoint, "Kubernetes API endpoint", owner="local.master_endpoint")
+    proxmox = values.get("proxmox") if isinstance(values.get("proxmox"), dict) else {}
+    if isinstance(proxmox.get("endpoint"), str):
+        from urllib.parse import urlsplit
+        host = urlsplit(proxmox["endpoint"]).hostname or ""
+        if parse_address(host) is not None:
+            _add_range(plan, host, "Proxmox API endpoint")
+    cluster = values.get("cluster_config") if isinstance(values.get("cluster_config"), dict) else {}
+    for key in ("podSubnets", "serviceSubnets"):
+        subnets = cluster.get(key)
+        for text in [subnets] if isinstance(subnets, str) else subnets or []:
+            _add_range(plan, text, key, "cluster")
+
+    _load_lb_manifests(plan, stack_dir)
+    return plan
+
+# =============================================================================
+# REPORT MODEL
+# =============================================================================
+
+@dataclass
+class Finding:
+    """A recommendation raised by one of the checks."""
+    severity: str  # "critical" or "warning"
+    message: str
+    host: Optional[str] = None
+    vms: List[str] = field(default_factory=list)
+    check: str = ""  # key of the check in HOST_CHECKS / FLEET_CHECKS
+
+@dataclass
+class HostReport:
+    """Utilization and CPU pinning of one host."""
+    host: str
+    sockets: int
+    cpus: int
+    memory: int  # MB
+    vms: List[VM]
+    total_vcpu: int
+    total_memory: int  # MB
+    total_disk: int  # GB
+    used: int  # CPU masks
+    overlap: int
+    free: int
+    beyond: int  # pinned CPUs the host does not have
+    overlaps: List[Tuple[int, int, List[str]]]
+    no_affinity: List[str]
+    topology: Topology
+    findings: List[Finding] = field(default_factory=list)
+
+    @property
+    def cpu_pct(self) -> float:
+        return (self.total_vcpu / self.cpus) * 100 if self.cpus else 0
+
+    @property
+    def mem_pct(self) -> float:
+        return (self.total_memory / self.memory) * 100 if self.memory else 0
+
+# Uplink assumed for a bridge missing from NODES[host]["nics"], Mbit/s
+DEFAULT_NIC_MBPS = 1000
+
+@dataclass
+class BridgeUsage:
+    """Guest rate limits on one host bridge against the uplink behind it."""
+    host: str
+    bridge: str
+    capacity: int  # uplink Mbit/s
+    limits: List[Tuple[str, int]]  # (guest, MB/s) for rate-limited guests
+    unlimited: List[str]  # guests with bandwidth_limit = 0
+
+    @property
+    def committed(self) -> int:
+        """Sum of the guests' rate limits in Mbit/s."""
+        return sum(limit for _, limit in self.limits) * 8
+
+    @property
+    def ratio(self) -> float:
+        return self.committed / self.capacity if self.capacity else 0.0
+
+@dataclass
+class NetworkReport:
+    ips: List[Tuple[str, str, str]]  # (ip, vm, host)
+    duplicates: Dict[str, List[str]]
+    bandwidth_limits: List[Tuple[str, int]]  # (vm, MB/s)
+    bridges: List[BridgeUsage]
+    plans: Dict[str, AddressPlan] = field(default_factory=dict)  # stack -> address plan
+
+# Datastore fill level reported as a warning, and the per-disk share of a
+# datastore's I/O budget below which its disks are expected to contend
+DATASTORE_WARN_PCT = 85
+DISK_IOPS_FLOOR = 500
+DISK_THROUGHPUT_FLOOR = 25  # MB/s
+
+@dataclass
+class DatastoreUsage:
+    """Disks one host keeps on one datastore, against the budgets declared in NODES."""
+    host: str
+    datastore: str
+    disks: List[Tuple[str, str, int]]  # (vm, disk, GB)
+    capacity: Optional[int] = None  # GB
+    iops: Optional[int] = None
+    throughput: Optional[int] = None  # MB/s
+
+    @property
+    def allocated(self) -> int:
+        return sum(size for _, _, size in self.disks)
+
+    @property
+    def pct(self) -> Optional[float]:
+        return self.allocated / self.capacity * 100 if self.capacity else None
+
+    @property
+    def iops_per_disk(self) -> Optional[int]:
+        """Fair share of the IOPS budget when every disk on the datastore is busy."""
+        return self.iops // len(self.disks) if self.iops and self.disks else None
+
+    @property
+    def throughput_per_disk(self) -> Optional[int]:
+        return self.throughput // len(self.disks) if self.throughput and self.disks else None
+
+@dataclass
+class StorageReport:
+    datastores: Dict[str, List[Tuple[str, int]]]  # datastore -> [(vm, GB)]
+    additional_disks: Dict[str, Dict[str, dict]]  # vm -> disk -> size, datastore_id, filesystem
+    pools: List[DatastoreUsage]  # per host and datastore
+
+@dataclass
+class Report:
+    stacks: Dict[str, int]  # stack -> VM count
+    hosts: List[HostReport]
+    network: NetworkReport
+    storage: StorageReport
+    kubelet: Dict[str, List["KubeletCapacity"]]  # workload tier -> worker VMs
+    findings: List[Finding]  # every finding, grouped by check
+
+def node_config_for(host: str) -> dict:
+    """Return the NODES entry for host, falling back to a small default node."""
+    return NODES.get(host, {"cores": 8, "memory": 32768, "sockets": 1})
+
+def load_nodes(path: Path):
+    """Merge a JSON node inventory ({host: NODES entry}, as vm-analyzer-bench.py --generate-fleet writes) into NODES."""
+    import json
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        raise ValueError(f"cannot read node inventory '{path}': {e}")
+    if not isinstance(data, dict):
+        raise ValueError(f"node inventory '{path}' must map host names to node settings")
+    for host, config in data.items():
+        if not isinstance(config, dict) or not isinstance(config.get("cores"), int) \
+                or not isinstance(config.get("memory"), int):
+            raise ValueError(f"node inventory '{path}': host '{host}' needs integer cores and memory")
+        NODES[host] = config
+
+def datastore_budgets(host: str) -> Optional[Dict[str, dict]]:
+    """NODES[host]["datastores"] as {datastore: {"capacity", "iops", "throughput"}}; None if undeclared.
+
+    A plain number is shorthand for {"capacity": number}.
+    """
+    declared = node_config_for(host).get("datastores")
+    if declared is None:
+        return None
+    return {ds: dict(budget) if isinstance(budget, dict) else {"capacity": budget}
+            for ds, budget in declared.items()}
+
+def vm_disks(vm: VM) -> List[Tuple[str, str, int]]:
+    """(disk, datastore, GB) for the root disk and every additional disk of a VM."""
+    disks = [("root", vm.datastore_id, vm.disk_size)]
+    disks += [(name, d['datastore_id'], d['size']) for name, d in vm.additional_disks.items()]
+    return disks
+
+def vm_disk_by_datastore(vm: VM) -> Dict[str, int]:
+    """GB a VM allocates on each datastore."""
+    sizes: Dict[str, int] = defaultdict(int)
+    for _, ds, size in vm_disks(vm):
+        sizes[ds] += size
+    return dict(sizes)
+
+def datastore_usage(host: str, host_vms: List[VM]) -> List[DatastoreUsage]:
+    """Group one host's disks by datastore and attach the declared budgets."""
+    budgets = datastore_budgets(host) or {}
+    by_ds: Dict[str, List[Tuple[str, str, int]]] = defaultdict(list)
+    for vm in host_vms:
+        for disk, ds, size in vm_disks(vm):
+            by_ds[ds].append((vm.name, disk, size))
+    return [DatastoreUsage(host, ds, sorted(disks), **{k: budgets.get(ds, {}).get(k) for k in ("capacity", "iops", "throughput")})
+            for ds, disks in sorted(by_ds.items())]
+
+def group_by_host(vms: List[VM]) -> Dict[str, List[VM]]:
+    by_host: Dict[str, List[VM]] = defaultdict(list)
+    for vm in vms:
+        by_host[vm.host_node].append(vm)
+    return by_host
+
+def bridge_usage(host: str, host_vms: List[VM]) -> List[BridgeUsage]:
+    """Aggregate the guests' bandwidth_limit per bridge of one host."""
+    nics = node_config_for(host).get("nics", {})
+    by_bridge: Dict[str, List[VM]] = defaultdict(list)
+    for vm in host_vms:
+        by_bridge[vm.bridge].append(vm)
+    return [BridgeUsage(host=host, bridge=bridge, capacity=nics.get(bridge, DEFAULT_NIC_MBPS),
+                        limits=sorted((vm.name, vm.bandwidth_limit) for vm in guests if vm.bandwidth_limit > 0),
+                        unlimited=sorted(vm.name for vm in guests if vm.bandwidth_limit <= 0))
+            for bridge, guests in sorted(by_bridge.items())]
+
+def find_overlaps(host_vms: List[VM]) -> List[Tuple[int, int, List[str]]]:
+    """Return (first_cpu, last_cpu, vm_names) for every CPU range pinned by more than one VM."""
+    _, overlap = overlap_mask(vm.affinity_mask for vm in host_vms)
+    if not overlap:
+        return []
+
+    involved = [vm for vm in host_vms if vm.affinity_mask & overlap]
+    # Split the overlapping CPUs wherever any involved VM's pinning starts or stops
+    edges = set()
+    for start, end in mask_ranges(overlap):
+        edges.update((start, end + 1))
+    for vm in involved:
+        for start, end in mask_ranges(vm.affinity_mask & overlap):
+            edges.update((start, end + 1))
+
+    overlaps: List[Tuple[int, int, List[str]]] = []
+    bounds = sorted(edges)
+    for start, stop in zip(bounds, bounds[1:]):
+        if not (overlap >> start) & 1:
+            continue
+        names = [vm.name for vm in involved if (vm.affinity_mask >> start) & 1]
+        if overlaps and overlaps[-1][1] == start - 1 and overlaps[-1][2] == names:
+            overlaps[-1] = (overlaps[-1][0], stop - 1, names)
+        else:
+            overlaps.append((start, stop - 1, names))
+    return overlaps
+
+# =============================================================================
+# KUBELET CAPACITY
+# =============================================================================
+
+# Kubelet defaults for flags the effective kubelet_extraArgs leave unset
+KUBELET_DEFAULT_MAX_PODS = 110
+KUBELET_DEFAULT_EVICTION_HARD = "memory.available<100Mi"
+
+# Guaranteed pod counted per tier: (millicores, MiB); set with --pod-size
+POD_SIZE = (1000, 1024)
+
+# Memory the node spends outside the kubelet's allocatable: every nf_conntrack
+# entry is a 320-byte slab object plus its share of the 8-byte hash buckets, and
+# every running pod has a pause container, a containerd shim and a Cilium
+# endpoint (MiB each)
+CONNTRACK_ENTRY_BYTES = 320
+CONNTRACK_BUCKET_BYTES = 8
+POD_OVERHEAD_MIB = {"pause": 1, "containerd-shim": 6, "cilium-endpoint": 1}
+POD_OVERHEAD_PER_POD = sum(POD_OVERHEAD_MIB.values())
+# Overhead beyond this share of allocatable memory is reported
+MEMORY_OVERHEAD_WARN_PCT = 10
+
+_QUANTITY_RE = re.compile(r'^([0-9]+(?:\.[0-9]+)?)([A-Za-z]*)$')
+_MEMORY_UNITS = {  # factor to MiB
+    "": 1 / 2**20, "k": 1e3 / 2**20, "M": 1e6 / 2**20, "G": 1e9 / 2**20, "T": 1e12 / 2**20,
+    "Ki": 1 / 2**10, "Mi": 1, "Gi": 2**10, "Ti": 2**20,
+}
+
+def parse_cpu_quantity(value: str) -> int:
+    """Kubernetes CPU quantity ("600m", "1", "0.5") in millicores."""
+    m = _QUANTITY_RE.match(value.strip())
+    if not m or m.group(2) not in ("", "m"):
+        raise ValueError(f"invalid CPU quantity '{value}'")
+    amount = float(m.group(1))
+    return int(amount) if m.group(2) == "m" else int(round(amount * 1000))
+
+def parse_memory_quantity(value: str) -> int:
+    """Kubernetes memory quantity ("1Gi", "500Mi", "1G", plain bytes) in MiB."""
+    m = _QUANTITY_RE.match(value.strip())
+    if not m or m.group(2) not in _MEMORY_UNITS:
+        raise ValueError(f"invalid memory quantity '{value}'")
+    return int(round(float(m.group(1)) * _MEMORY_UNITS[m.group(2)]))
+
+def _split_pairs(value: str, sep: str) -> Dict[str, str]:
+    """"cpu=600m,memory=1Gi" -> {"cpu": "600m", "memory": "1Gi"} (sep "=" or "<")."""
+    pairs = {}
+    for item in value.split(","):
+        key, found, val = item.partition(sep)
+        if not found:
+            raise ValueError(f"expected key{sep}value, got '{item}'")
+        pairs[key.strip()] = val.strip()
+    return pairs
+
+def default_conntrack_buckets(memory: int) -> int:
+    """nf_conntrack_buckets the kernel (5.15+) sizes from RAM in MiB; nf_conntrack_max defaults to the same."""
+    if memory > 4096:
+        return 262144
+    if memory > 1024:
+        return 65536
+    return max(memory * 2**20 // 16384 // 8, 1024)
+
+def conntrack_table(sysctls: Dict[str, str], memory: int) -> Tuple[int, int]:
+    """(nf_conntrack_max, MiB the table takes when full) from a VM's sysctls."""
+    sizes = {}
+    for name in ("nf_conntrack_buckets", "nf_conntrack_max"):
+        value = sysctls.get(f"net.netfilter.{name}")
+        if value is not None and not value.strip().isdigit():
+            raise ValueError(f"net.netfilter.{name}: not an integer '{value}'")
+        sizes[name] = int(value) if value is not None else None
+    buckets = sizes["nf_conntrack_buckets"] or default_conntrack_buckets(memory)
+    entries = sizes["nf_conntrack_max"] if sizes["nf_conntrack_max"] is not None else buckets
+    return entries, -(-(entries * CONNTRACK_ENTRY_BYTES + buckets * CONNTRACK_BUCKET_BYTES) // 2**20)
+
+def set_pod_size(spec: str):
+    """Set POD_SIZE from "CPU,MEMORY" quantities such as "500m,512Mi"."""
+    global POD_SIZE
+    cpu, sep, memory = spec.partition(",")
+    if not sep:
+        raise ValueError(f"--pod-size expects CPU,MEMORY, got '{spec}'")
+    size = (parse_cpu_quantity(cpu), parse_memory_quantity(memory))
+    if min(size) <= 0:
+        raise ValueError(f"--pod-size must be positive, got '{spec}'")
+    POD_SIZE = size
+
+@dataclass
+class KubeletCapacity:
+    """What the kubelet on one worker VM can hand to pods, from its effective kubelet_extraArgs."""
+    vm: str
+    host: str
+    workload: Optional[str]
+    cpu: int  # millicores the node reports
+    memory: int  # MiB the node reports
+    reserved_cpu: int  # millicores held back (kube/system-reserved, or reserved-cpus)
+    reserved_memory: int  # MiB held back (kube/system-reserved plus the hard eviction threshold)
+    max_pods: int
+    exclusive_cpus: Optional[int]  # static CPU manager pool for guaranteed pods; None without it
+    conntrack_max: int = 0
+    conntrack_memory: int = 0  # MiB a full conntrack table takes
+    invalid: List[str] = field(default_factory=list)  # flags that could not be parsed
+
+    @property
+    def allocatable_cpu(self) -> int:
+        return max(self.cpu - self.reserved_cpu, 0)
+
+    @property
+    def workload_memory(self) -> int:
+        """MiB left for pods and their runtime overhead once reservations, eviction and conntrack are paid."""
+        return max(self.allocatable_memory - self.conntrack_memory, 0)
+
+    @property
+    def allocatable_memory(self) -> int:
+        return max(self.memory - self.reserved_memory, 0)
+
+    def pod_overhead(self, pods: int) -> int:
+        """MiB of pause containers, shims and Cilium endpoints of `pods` running pods."""
+        return pods * POD_OVERHEAD_PER_POD
+
+    def _cpu_fit(self, pod_cpu: int) -> int:
+        fit = min(self.allocatable_cpu // pod_cpu, self.max_pods)
+        if self.exclusive_cpus is not None and pod_cpu % 1000 == 0:
+            # Integer-CPU guaranteed pods take whole CPUs from the exclusive pool
+            fit = min(fit, self.exclusive_cpus // (pod_cpu // 1000))
+        return fit
+
+    def pods_scheduled(self, pod_cpu: int, pod_memory: int) -> int:
+        """Guaranteed pods of the given size the scheduler places, which only sees allocatable memory."""
+        return min(self._cpu_fit(pod_cpu), self.allocatable_memory // pod_memory)
+
+    def pods_fit(self, pod_cpu: int, pod_memory: int) -> int:
+        """Guaranteed pods of the given size the node holds with each pod's runtime overhead paid."""
+        return min(self._cpu_fit(pod_cpu), self.workload_memory // (pod_memory + POD_OVERHEAD_PER_POD))
+
+# Workers of one tier share their flags and size, so each combination is parsed once
+_KUBELET_CAPACITIES: Dict[tuple, KubeletCapacity] = {}
+
+def kubelet_capacity(vm: VM) -> KubeletCapacity:
+    """Model the kubelet's allocatable resources on a worker VM."""
+    key = (tuple(sorted(vm.kubelet_args.items())), tuple(sorted(vm.sysctls.items())), vm.cpu, vm.ram_dedicated)
+    cap = _KUBELET_CAPACITIES.get(key)
+    if cap is None:
+        cap = _KUBELET_CAPACITIES[key] = _kubelet_capacity(vm.kubelet_args, vm.sysctls, vm.cpu, vm.ram_dedicated)
+    return replace(cap, vm=vm.name, host=vm.host_node, workload=vm.workload, invalid=list(cap.invalid))
+
+def _kubelet_capacity(args: Dict[str, str], sysctls: Dict[str, str], cpu: int, memory: int) -> KubeletCapacity:
+    cap = KubeletCapacity(vm="", host="", workload=None, cpu=cpu * 1000, memory=memory,
+                          reserved_cpu=0, reserved_memory=0, max_pods=KUBELET_DEFAULT_MAX_PODS, exclusive_cpus=None)
+
+    for flag in ("kube-reserved", "system-reserved"):
+        if flag not in args:
+            continue
+        try:
+            reserved = _split_pairs(args[flag], "=")
+            cap.reserved_cpu += parse_cpu_quantity(reserved.get("cpu", "0"))
+            cap.reserved_memory += parse_memory_quantity(reserved.get("memory", "0"))
+        except ValueError as e:
+            cap.invalid.append(f"{flag}: {e}")
+
+    # An explicit reserved CPU set replaces the CPU part of kube/system-reserved
+    reserved_cpus = None
+    if args.get("reserved-cpus"):
+        try:
+            reserved_cpus = parse_affinity(args["reserved-cpus"]).bit_count()
+            cap.reserved_cpu = reserved_cpus * 1000
+        except ValueError as e:
+            cap.invalid.append(f"reserved-cpus: {e}")
+
+    try:
+        eviction = _split_pairs(args.get("eviction-hard", KUBELET_DEFAULT_EVICTION_HARD), "<")
+        threshold = eviction.get("memory.available", "0")
+        if threshold.endswith("%"):
+            cap.reserved_memory += int(memory * float(threshold[:-1]) / 100)
+        else:
+            cap.reserved_memory += parse_memory_quantity(threshold)
+    except ValueError as e:
+        cap.invalid.append(f"eviction-hard: {e}")
+
+    if "max-pods" in args:
+        try:
+            cap.max_pods = int(args["max-pods"])
+        except ValueError:
+            cap.invalid.append(f"max-pods: not an integer '{args['max-pods']}'")
+
+    if args.get("cpu-manager-policy") == "static":
+        # The static policy keeps ceil(reserved) whole CPUs out of the exclusive pool
+        held = reserved_cpus if reserved_cpus is not None else -(-cap.reserved_cpu // 1000)
+        cap.exclusive_cpus = max(cpu - held, 0)
+
+    try:
+        cap.conntrack_max, cap.conntrack_memory = conntrack_table(sysctls, memory)
+    except ValueError as e:
+        cap.invalid.append(f"sysctl {e}")
+        cap.conntrack_max, cap.conntrack_memory = conntrack_table({}, memory)
+    return cap
+
+def build_kubelet_report(vms: List[VM]) -> Dict[str, List[KubeletCapacity]]:
+    """Kubelet capacity of every worker VM, grouped by workload tier."""
+    tiers: Dict[str, List[KubeletCapacity]] = defaultdict(list)
+    for vm in sorted(vms, key=lambda v: v.name):
+        if vm.role == "worker":
+            tiers[vm.workload or "default"].append(kubelet_capacity(vm))
+    return dict(sorted(tiers.items()))
+
+# =============================================================================
+# CHECKS
+# =============================================================================
+
+def check_affinity_overlap(host: str, host_vms: List[VM]) -> List[Finding]:
+    _, overlap = overlap_mask(vm.affinity_mask for vm in host_vms)
+    if overlap:
+        names = [vm.name for vm in host_vms if vm.affinity_mask & overlap]
+        return [Finding("critical", f"Host '{host}' has overlapping CPU affinities. Fix immediately for CPU pinning to work correctly.", host, names)]
+    return []
+
+def check_missing_affinity(host: str, host_vms: List[VM]) -> List[Finding]:
+    return [Finding("warning", f"VM '{vm.name}' has no CPU affinity set.", host, [vm.name])
+            for vm in host_vms if vm.pinnable and not vm.cpu_affinity]
+
+def check_numa_consistency(host: str, host_vms: List[VM]) -> List[Finding]:
+    numa_enabled = [vm for vm in host_vms if vm.pinnable and vm.numa]
+    numa_disabled = [vm for vm in host_vms if vm.pinnable and not vm.numa]
+    if numa_enabled and numa_disabled:
+        return [Finding("warning", f"Host '{host}' has mixed NUMA settings. Consider enabling NUMA for all VMs for consistency.", host, [vm.name for vm in numa_disabled])]
+    return []
+
+def check_overcommit(host: str, host_vms: List[VM]) -> List[Finding]:
+    node_config = node_config_for(host)
+    host_cpus = node_config["cores"]
+    host_memory = node_config["memory"]
+
+    findings = []
+    total_vcpu = sum(vm.cpu for vm in host_vms)
+    total_memory = sum(vm.ram_dedicated for vm in host_vms)
+    if total_vcpu > host_cpus:
+        findings.append(Finding("warning", f"Host '{host}' has vCPU overcommit ({total_vcpu}/{host_cpus}). This may cause performance issues with CPU pinning.", host))
+    if total_memory > host_memory:
+        findings.append(Finding("critical", f"Host '{host}' has memory overcommit ({total_memory}MB/{host_memory}MB). VMs may fail to start or be OOM killed.", host))
+    return findings
+
+def check_numa_span(host: str, host_vms: List[VM]) -> List[Finding]:
+    topology = node_topology(host)
+    if len(topology.numa_cpus) < 2:
+        return []
+    findings = []
+    for vm in host_vms:
+        nodes = topology.nodes_of(vm.affinity_mask)
+        if len(nodes) > 1:
+            findings.append(Finding("warning", f"VM '{vm.name}' cpu_affinity {vm.cpu_affinity} spans NUMA nodes {', '.join(map(str, nodes))}. Memory access will cross sockets.", host, [vm.name]))
+    return findings
+
+def check_smt_sharing(host: str, host_vms: List[VM]) -> List[Finding]:
+    siblings = node_topology(host).siblings
+    if not siblings:
+        return []
+    # Pairs of VMs pinned to different threads of the same physical core
+    shared: Dict[Tuple[str, str], int] = defaultdict(int)
+    for core in siblings:
+        users = [vm for vm in host_vms if vm.affinity_mask & core]
+        for i, a in enumerate(users):
+            for b in users[i + 1:]:
+                if not (a.affinity_mask & b.affinity_mask & core):
+                    shared[(a.name, b.name)] |= core & (a.affinity_mask | b.affinity_mask)
+    return [Finding("warning", f"VMs '{a}' and '{b}' share SMT sibling threads (CPUs {format_ranges(cpus)}). Pin whole cores to each VM.", host, [a, b])
+            for (a, b), cpus in shared.items()]
+
+def check_numa_memory(host: str, host_vms: List[VM]) -> List[Finding]:
+    largest = max(node_topology(host).numa_memory, default=0)
+    return [Finding("warning", f"VM '{vm.name}' has NUMA enabled but its {vm.ram_dedicated}MB RAM exceeds the largest NUMA node ({largest}MB).", host, [vm.name])
+            for vm in host_vms if vm.numa and largest and vm.ram_dedicated > largest]
+
+def check_bandwidth(host: str, host_vms: List[VM]) -> List[Finding]:
+    findings = []
+    for usage in bridge_usage(host, host_vms):
+        # Unlimited guests only defeat limits set on their neighbours; a bridge with no limits at all shares fairly
+        if usage.unlimited and usage.limits:
+            findings.append(Finding("warning", f"Host '{host}' bridge {usage.bridge}: {len(usage.unlimited)} guest(s) without bandwidth_limit ({', '.join(usage.unlimited)}) can each saturate the {usage.capacity} Mbit/s uplink and starve the rate-limited guests.", host, usage.unlimited))
+        if usage.ratio > 1:
+            findings.append(Finding("warning", f"Host '{host}' bridge {usage.bridge} is oversubscribed {usage.ratio:.1f}x: guest limits total {usage.committed} Mbit/s on a {usage.capacity} Mbit/s uplink.", host, [name for name, _ in usage.limits]))
+    return findings
+
+def check_datastore_capacity(host: str, host_vms: List[VM]) -> List[Finding]:
+    findings = []
+    for pool in datastore_usage(host, host_vms):
+        pct = pool.pct
+        if pct is None or pct < DATASTORE_WARN_PCT:
+            continue
+        severity = "critical" if pct > 100 else "warning"
+        findings.append(Finding(severity, f"Host '{host}' datastore {pool.datastore} is {pct:.0f}% allocated ({pool.allocated}GB/{pool.capacity}GB).", host,
+                                sorted({vm for vm, _, _ in pool.disks})))
+    return findings
+
+def check_io_contention(host: str, host_vms: List[VM]) -> List[Finding]:
+    findings = []
+    for pool in datastore_usage(host, host_vms):
+        iops, mbps = pool.iops_per_disk, pool.throughput_per_disk
+        short = []
+        if iops is not None and iops < DISK_IOPS_FLOOR:
+            short.append(f"{iops} IOPS")
+        if mbps is not None and mbps < DISK_THROUGHPUT_FLOOR:
+            short.append(f"{mbps} MB/s")
+        if short:
+            findings.append(Finding("warning", f"Host '{host}' datastore {pool.datastore} shares its I/O budget across {len(pool.disks)} disks: {' and '.join(short)} per disk when all are busy.", host,
+                                    sorted({vm for vm, _, _ in pool.disks})))
+    return findings
+
+def check_kubelet_capacity(host: str, host_vms: List[VM]) -> List[Finding]:
+    pod_cpu, pod_memory = POD_SIZE
+    findings = []
+    for vm in host_vms:
+        if vm.role != "worker":
+            continue
+        cap = kubelet_capacity(vm)
+        for problem in cap.invalid:
+            findings.append(Finding("warning", f"VM '{vm.name}' has an invalid kubelet flag or sysctl ({problem}); defaults were assumed.", host, [vm.name]))
+        if not cap.allocatable_cpu or not cap.allocatable_memory:
+            findings.append(Finding("critical", f"VM '{vm.name}' kubelet reservations leave no allocatable {'CPU' if not cap.allocatable_cpu else 'memory'} ({cap.allocatable_cpu}m CPU, {cap.allocatable_memory}Mi memory).", host, [vm.name]))
+        elif cap.exclusive_cpus is not None and not cap.reserved_cpu:
+            findings.append(Finding("critical", f"VM '{vm.name}' uses the static CPU manager without a CPU reservation; the kubelet refuses to start. Set kube-reserved/system-reserved cpu or reserved-cpus.", host, [vm.name]))
+        elif not cap.pods_fit(pod_cpu, pod_memory):
+            findings.append(Finding("warning", f"VM '{vm.name}' cannot hold a single guaranteed pod of {pod_cpu}m CPU / {pod_memory}Mi ({cap.allocatable_cpu}m allocatable, {cap.workload_memory}Mi free for workloads).", host, [vm.name]))
+
+        # The scheduler fills allocatable memory; conntrack and the scheduled pods' overhead come on top of it
+        scheduled = cap.pods_scheduled(pod_cpu, pod_memory)
+        fit = cap.pods_fit(pod_cpu, pod_memory)
+        overhead = cap.conntrack_memory + cap.pod_overhead(scheduled)
+        if cap.allocatable_memory and overhead * 100 > cap.allocatable_memory * MEMORY_OVERHEAD_WARN_PCT:
+            severity = "critical" if scheduled and not fit else "warning"
+            impact = (f"only {fit} of them fit in its {cap.allocatable_memory}Mi allocatable once that is paid, so a full node can OOM"
+                      if fit < scheduled else f"that is over {MEMORY_OVERHEAD_WARN_PCT}% of its {cap.allocatable_memory}Mi allocatable")
+            findings.append(Finding(severity, f"VM '{vm.name}' spends {overhead}Mi outside allocatable memory on a full conntrack table ({cap.conntrack_max} entries, {cap.conntrack_memory}Mi) and runtime overhead of {scheduled} scheduled pods ({cap.pod_overhead(scheduled)}Mi); {impact}. Lower max-pods/nf_conntrack_max or raise ram_dedicated.", host, [vm.name]))
+    return findings
+
+def check_master_spread(vms: List[VM], plans: Optional[AddressPlans] = None) -> List[Finding]:
+    masters_by_host = defaultdict(list)
+    for vm in vms:
+        if vm.role == "master":
+            masters_by_host[vm.host_node].append(vm)
+
+    if len(masters_by_host) == 1 and len(list(masters_by_host.values())[0]) > 1:
+        (host, masters), = masters_by_host.items()
+        return [Finding("warning", "All master nodes are on a single host. Consider distributing across hosts for HA.", host, [vm.name for vm in masters])]
+    return []
+
+def check_duplicate_ips(vms: List[VM], plans: Optional[AddressPlans] = None) -> List[Finding]:
+    ip_names = defaultdict(list)
+    for vm in vms:
+        if vm.ip:
+            addr = parse_address(vm.ip)
+            ip_names[str(addr) if addr is not None else vm.ip].append(vm)
+    return [Finding("critical", f"IP {ip} is used by {', '.join(vm.name for vm in dupes)}.",
+                    dupes[0].host_node if len({vm.host_node for vm in dupes}) == 1 else None, [vm.name for vm in dupes])
+            for ip, dupes in ip_names.items() if len(dupes) > 1]
+
+def check_ip_plan(vms: List[VM], plans: Optional[AddressPlans] = None) -> List[Finding]:
+    """Check guest IPs and LoadBalancer pools against each stack's address plan."""
+    plans = plans or AddressPlans()
+    findings = []
+    for vm in vms:
+        if not vm.ip:
+            continue
+        addr = parse_address(vm.ip)
+        if addr is None:
+            findings.append(Finding("warning", f"VM '{vm.name}' has an invalid IP address '{vm.ip}'.", vm.host_node, [vm.name]))
+            continue
+        plan = plans.get(vm.stack)
+        if plan is None:
+            continue
+        if plan.subnet is not None and (addr.version != plan.subnet.version or addr not in plan.subnet):
+            findings.append(Finding("warning", f"VM '{vm.name}' IP {addr} is outside the network {plan.subnet}.", vm.host_node, [vm.name]))
+        for r in plan.index.overlapping(addr):
+            if not (r.owner and r.owner == vm.ip_ref):
+                findings.append(Finding("critical", f"VM '{vm.name}' IP {addr} collides with the {r.label} ({r}).", vm.host_node, [vm.name]))
+
+    for stack in sorted({vm.stack for vm in vms}):
+        plan = plans.get(stack)
+        if plan is None:
+            continue
+        pools = [r for r in plan.ranges if r.kind == "lb_pool"]
+        for i, pool in enumerate(pools):
+            for r in plan.index.overlapping(pool.first, pool.last):
+                # Skip the pool itself and pool pairs already reported
+                if r.kind != "cluster" and not any(r is p for p in pools[:i + 1]):
+                    findings.append(Finding("critical", f"{pool.label} ({pool}) overlaps the {r.label} ({r}).", None, []))
+        if plan.subnet is not None:
+            for r in plan.ranges:
+                if r.kind == "cluster" and r.first.version == plan.subnet.version \
+                        and r.first <= plan.subnet.broadcast_address and r.last >= plan.subnet.network_address:
+                    findings.append(Finding("critical", f"{r.label} {r} overlaps the node network {plan.subnet}.", None, []))
+    return findings
+
+# Per-host checks, in the order they are reported
+HOST_CHECKS = {
+    "affinity_overlap": check_affinity_overlap,
+    "missing_affinity": check_missing_affinity,
+    "numa_consistency": check_numa_consistency,
+    "overcommit": check_overcommit,
+    "numa_span": check_numa_span,
+    "smt_sharing": check_smt_sharing,
+    "numa_memory": check_numa_memory,
+    "bandwidth": check_bandwidth,
+    "datastore_capacity": check_datastore_capacity,
+    "io_contention": check_io_contention,
+    "kubelet_capacity": check_kubelet_capacity,
+}
+
+# Checks that need every VM in the fleet, called with the fleet's address plans
+FLEET_CHECKS = {
+    "master_spread": check_master_spread,
+    "duplicate_ip": check_duplicate_ips,
+    "ip_plan": check_ip_plan,
+}
+
+def host_recommendations(host: str, host_vms: List[VM]) -> List[Finding]:
+    """Run every per-host check for a single host."""
+    findings = []
+    for name, check in HOST_CHECKS.items():
+        for finding in check(host, host_vms):
+            finding.check = name
+            findings.append(finding)
+    return findings
+
+# Exit codes of --check by worst severity found; 1 stays reserved for errors
+CHECK_EXIT_CODES = {"warning": 3, "critical": 4}
+
+def iter_findings(vms: List[VM], names: List[str], plans: Optional[AddressPlans] = None) -> Iterator[Finding]:
+    """Findings of the named checks, lazily and in report order, so callers can stop early."""
+    by_host = sorted(group_by_host(vms).items())
+    for name in HOST_CHECKS:
+        if name in names:
+            for host, host_vms in by_host:
+                for finding in HOST_CHECKS[name](host, host_vms):
+                    finding.check = name
+                    yield finding
+    for name in FLEET_CHECKS:
+        if name in names:
+            for finding in FLEET_CHECKS[name](vms, plans):
+                finding.check = name
+                yield finding
+
+def run_checks(vms: List[VM], names: List[str], fail_fast: bool = False, out: TextIO = sys.stdout,
+               plans: Optional[AddressPlans] = None, errors: Optional[List[Finding]] = None) -> int:
+    """Print one line per violation and return the exit code for the worst severity.
+
+    errors (files that failed to parse) are always reported first, whichever
+    checks were selected, since those checks never saw the files' VMs.
+    """
+    code = 0
+    for finding in itertools.chain(errors or [], iter_findings(vms, names, plans)):
+        where = f"{finding.host}: " if finding.host else ""
+        print(f"{finding.severity}: [{finding.check}] {where}{finding.message}", file=out)
+        code = max(code, CHECK_EXIT_CODES[finding.severity])
+        if fail_fast:
+            break
+    return code
+
+def fleet_recommendations(vms: List[VM], plans: Optional[AddressPlans] = None) -> List[Finding]:
+    findings = []
+    for name, check in FLEET_CHECKS.items():
+        for finding in check(vms, plans):
+            finding.check = name
+            findings.append(finding)
+    return findings
+
+# =============================================================================
+# REPORT BUILDING
+# =============================================================================
+
+def build_host_report(host: str, host_vms: List[VM]) -> HostReport:
+    """Compute utilization, CPU pinning and findings for one host."""
+    node_config = node_config_for(host)
+    host_cpus = node_config["cores"]
+    all_cpus = cpu_mask(host_cpus)
+    used, overlap = overlap_mask(vm.affinity_mask for vm in host_vms)
+
+    return HostReport(
+        host=host,
+        sockets=node_config.get("sockets", 1),
+        cpus=host_cpus,
+        memory=node_config["memory"],
+        vms=host_vms,
+        total_vcpu=sum(vm.cpu for vm in host_vms),
+        total_memory=sum(vm.ram_dedicated for vm in host_vms),
+        total_disk=sum(size for vm in host_vms for _, _, size in vm_disks(vm)),
+        used=used,
+        overlap=overlap,
+        free=all_cpus & ~used,
+        beyond=used & ~all_cpus,
+        overlaps=find_overlaps(host_vms),
+        no_affinity=[vm.name for vm in host_vms if vm.pinnable and not vm.cpu_affinity],
+        topology=node_topology(host),
+        findings=host_recommendations(host, host_vms),
+    )
+
+def _ip_sort_key(ip: str) -> tuple:
+    """Numeric address order; unset and invalid addresses last."""
+    addr = parse_address(ip) if ip else None
+    return (0, addr.version, int(addr), ip) if addr is not None else (1, 0, 0, ip)
+
+def build_network_report(vms: List[VM], plans: Optional[AddressPlans] = None) -> NetworkReport:
+    plans = plans or AddressPlans()
+    ip_names = defaultdict(list)
+    for vm in vms:
+        if vm.ip:
+            addr = parse_address(vm.ip)
+            ip_names[str(addr) if addr is not None else vm.ip].append(vm.name)
+    return NetworkReport(
+        ips=sorted(((vm.ip, vm.name, vm.host_node) for vm in vms), key=lambda e: (_ip_sort_key(e[0]), e[1])),
+        duplicates={ip: names for ip, names in sorted(ip_names.items(), key=lambda e: _ip_sort_key(e[0])) if len(names) > 1},
+        bandwidth_limits=sorted((vm.name, vm.bandwidth_limit) for vm in vms if vm.bandwidth_limit > 0),
+        bridges=[usage for host, host_vms in sorted(group_by_host(vms).items())
+                 for usage in bridge_usage(host, host_vms)],
+        plans={stack: plan for stack in sorted({vm.stack for vm in vms})
+               if (plan := plans.get(stack)) is not None and (plan.subnet is not None or plan.ranges)},
+    )
+
+def build_storage_report(vms: List[VM]) -> StorageReport:
+    by_datastore: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+    for vm in vms:
+        for ds, size in vm_disk_by_datastore(vm).items():
+            by_datastore[ds].append((vm.name, size))
+    return StorageReport(
+        datastores=dict(sorted(by_datastore.items())),
+        additional_disks={vm.name: dict(vm.additional_disks) for vm in vms if vm.additional_disks},
+        pools=[usage for host, host_vms in sorted(group_by_host(vms).items())
+               for usage in datastore_usage(host, host_vms)],
+    )
+
+def order_findings(host_reports: List[HostReport], fleet_findings: List[Finding]) -> List[Finding]:
+    """All findings grouped by check in HOST_CHECKS order, then fleet-wide ones."""
+    order = {name: i for i, name in enumerate(HOST_CHECKS)}
+    host_findings = [f for hr in host_reports for f in hr.findings]
+    return sorted(host_findings, key=lambda f: order[f.check]) + fleet_findings
+
+def build_report(vms: List[VM], stacks: Optional[Dict[str, int]] = None,
+                 plans: Optional[AddressPlans] = None, errors: Optional[List[Finding]] = None) -> Report:
+    """Run the whole analysis without printing anything."""
+    with PROFILE.phase("analysis.hosts"):
+        hosts = [build_host_report(host, host_vms) for host, host_vms in sorted(group_by_host(vms).items())]
+    with PROFILE.phase("analysis.network"):
+        network = build_network_report(vms, plans)
+    with PROFILE.phase("analysis.storage"):
+        storage = build_storage_report(vms)
+    with PROFILE.phase("analysis.kubelet"):
+        kubelet = build_kubelet_report(vms)
+    with PROFILE.phase("analysis.findings"):
+        findings = (errors or []) + order_findings(hosts, fleet_recommendations(vms, plans))
+    return Report(stacks=stacks or {}, hosts=hosts, network=network, storage=storage,
+                  kubelet=kubelet, findings=findings)
+
+# =============================================================================
+# TEXT RENDERER
+# =============================================================================
+
+SEVERITY_COLORS = {"critical": Colors.RED, "warning": Colors.YELLOW}
+
+# CPU map cells: 0 = free, 1 = used, 2 = overlap
+_CPU_MAP_CELLS = {
+    '0': f"{Colors.WHITE}░",
+    '1': f"{Colors.GREEN}█",
+    '2': f"{Colors.RED}{Colors.BOLD}█",
+}
+_CPU_MAP_RUN_RE = re.compile(r'0+|1+|2+')
+CPU_MAP_ROW = 64  # CPUs per CPU map line
+
+def render_cpu_map(host_cpus: int, used: int, overlap: int) -> List[str]:
+    """Render the CPU map as (cells, numbers) line pairs, colouring runs rather than single CPUs."""
+    cells = list(format(used & cpu_mask(host_cpus), f"0{host_cpus}b")[::-1])
+    for start, end in mask_ranges(overlap & cpu_mask(host_cpus)):
+        cells[start:end + 1] = '2' * (end - start + 1)
+    cells = ''.join(cells)
+    digits = ("0123456789" * (host_cpus // 10 + 1))[:host_cpus]
+
+    def colour(run):
+        text = run.group()
+        cell = _CPU_MAP_CELLS[text[0]]
+        return f"{cell[:-1]}{cell[-1] * len(text)}{Colors.RESET}"
+
+    lines = []
+    for row in range(0, host_cpus, CPU_MAP_ROW):
+        groups = range(row, min(row + CPU_MAP_ROW, host_cpus), 8)
+        lines.append(" ".join(_CPU_MAP_RUN_RE.sub(colour, cells[g:g + 8]) for g in groups) + " ")
+        lines.append(" ".join(digits[g:g + 8] for g in groups) + " ")
+    return lines
+
+def format_finding(finding: Finding) -> str:
+    return f"{SEVERITY_COLORS[finding.severity]}[{finding.severity.upper()}]{Colors.RESET} {finding.message}"
+
+def render_preamble(out: TextIO, vm_count: int, stacks: Dict[str, int], errors: Optional[List[Finding]] = None):
+    """Print the configured nodes, scanned stacks, files skipped over syntax errors and VM count."""
+    print(f"\n{Colors.BOLD}Configured Nodes:{Colors.RESET}", file=out)
+    for name, config in NODES.items():
+        print(f"  {name}: {config['cores']} cores, {config['memory']/1024:.0f}GB RAM, {config.get('sockets', 1)} socket(s)", file=out)
+
+    stacks_with_vms = {name: count for name, count in stacks.items() if count}
+    if len(stacks_with_vms) > 1:
+        print(f"\n{Colors.BOLD}Stacks:{Colors.RESET}", file=out)
+        for name, count in sorted(stacks_with_vms.items()):
+            print(f"  {name}: {count} VMs", file=out)
+
+    if errors:
+        print(f"\n{Colors.BOLD}Skipped:{Colors.RESET}", file=out)
+        for finding in errors:
+            print(f"  {Colors.RED}{finding.message}{Colors.RESET}", file=out)
+
+    print(f"\nFound {vm_count} VMs in Terraform configuration", file=out)
+
+def render_host_utilization(hr: HostReport, out: TextIO):
+    """Print section 1 (overall utilization) for one host."""
+    cpu_color = Colors.GREEN if hr.cpu_pct <= 80 else Colors.YELLOW if hr.cpu_pct <= 100 else Colors.RED
+    mem_color = Colors.GREEN if hr.mem_pct <= 80 else Colors.YELLOW if hr.mem_pct <= 100 else Colors.RED
+
+    print(f"{Colors.BOLD}Host: {hr.host}{Colors.RESET} ({hr.sockets} socket, {hr.cpus} cores, {hr.memory/1024:.0f}GB RAM)", file=out)
+    print(f"  VMs: {len(hr.vms)}", file=out)
+    print(f"  vCPUs: {hr.total_vcpu}/{hr.cpus} ({cpu_color}{hr.cpu_pct:.1f}%{Colors.RESET})", file=out)
+    print(f"  Memory: {hr.total_memory}MB/{hr.memory}MB ({mem_color}{hr.mem_pct:.1f}%{Colors.RESET})", file=out)
+    print(f"  Total Disk: {hr.total_disk}GB", file=out)
+    print(file=out)
+
+    # Per-VM details
+    print(f"  {'VM Name':<25} {'Role':<8} {'vCPU':<6} {'RAM':<10} {'Affinity':<12} {'NUMA':<6} {'Workload':<15}", file=out)
+    print(f"  {'-'*25} {'-'*8} {'-'*6} {'-'*10} {'-'*12} {'-'*6} {'-'*15}", file=out)
+
+    for vm in sorted(hr.vms, key=lambda v: v.name):
+        print(f"  {vm.name:<25} {vm.role:<8} {vm.cpu:<6} {vm.ram_dedicated:<10} {vm.cpu_affinity or 'N/A':<12} {str(vm.numa):<6} {vm.workload or '-':<15}", file=out)
+    print(file=out)
+
+def render_host_affinity(hr: HostReport, out: TextIO):
+    """Print section 2 (CPU affinity map, free ranges, overlaps) for one host."""
+    print(f"{Colors.BOLD}Host: {hr.host}{Colors.RESET}", file=out)
+
+    # CPU usage visualization
+    print(f"\n  CPU Map (0-{hr.cpus-1}):", file=out)
+    for line in render_cpu_map(hr.cpus, hr.used, hr.overlap):
+        print(f"  {line}", file=out)
+
+    print(f"\n  Legend: {Colors.GREEN}█{Colors.RESET} used   {Colors.WHITE}░{Colors.RESET} free   {Colors.RED}{Colors.BOLD}█{Colors.RESET} overlap", file=out)
+
+    # NUMA layout, when the host has more than a single flat node
+    topology = hr.topology
+    if len(topology.numa_cpus) > 1 or topology.siblings:
+        print(file=out)
+        for n, (cpus, memory) in enumerate(zip(topology.numa_cpus, topology.numa_memory)):
+            pinned = (hr.used & cpus).bit_count()
+            print(f"  NUMA node {n}: CPUs {format_ranges(cpus)} ({memory/1024:.0f}GB RAM, {pinned}/{cpus.bit_count()} pinned)", file=out)
+        if topology.siblings:
+            print(f"  SMT: {len(topology.siblings)} core(s) with {max(s.bit_count() for s in topology.siblings)} threads each", file=out)
+
+    # Free CPU ranges
+    if hr.free:
+        print(f"\n  {Colors.GREEN}Free CPU ranges:{Colors.RESET} {format_ranges(hr.free)}", file=out)
+        print(f"  {Colors.GREEN}Free CPU count:{Colors.RESET} {hr.free.bit_count()}", file=out)
+    else:
+        print(f"\n  {Colors.YELLOW}No free CPUs available!{Colors.RESET}", file=out)
+
+    # Pinning outside the host's CPUs never takes effect
+    if hr.beyond:
+        print(f"\n  {Colors.YELLOW}Affinity beyond host CPUs:{Colors.RESET} {format_ranges(hr.beyond)}", file=out)
+
+    # Overlapping warnings
+    if hr.overlaps:
+        print(f"\n  {Colors.RED}{Colors.BOLD}OVERLAPPING CPU AFFINITY DETECTED!{Colors.RESET}", file=out)
+        for start, end, vm_names in hr.overlaps:
+            cpus = f"CPU {start}" if start == end else f"CPUs {start}-{end}"
+            print(f"    {cpus}: {', '.join(vm_names)}", file=out)
+    else:
+        print(f"\n  {Colors.GREEN}No CPU affinity overlaps detected.{Colors.RESET}", file=out)
+
+    # VMs without affinity
+    if hr.no_affinity:
+        print(f"\n  {Colors.YELLOW}VMs without CPU affinity:{Colors.RESET}", file=out)
+        for name in hr.no_affinity:
+            print(f"    - {name}", file=out)
+
+    print(file=out)
+
+def render_network(network: NetworkReport, out: TextIO):
+    """Print section 3 (IP allocation, duplicates, address plans, bandwidth limits)."""
+    # IP allocation
+    print(f"  {'IP Address':<20} {'VM Name':<25} {'Host':<15}", file=out)
+    print(f"  {'-'*20} {'-'*25} {'-'*15}", file=out)
+    for ip, name, host in network.ips:
+        print(f"  {ip:<20} {name:<25} {host:<15}", file=out)
+
+    # Check for duplicate IPs
+    if network.duplicates:
+        print(f"\n  {Colors.RED}{Colors.BOLD}DUPLICATE IP ADDRESSES DETECTED!{Colors.RESET}", file=out)
+        for ip, names in network.duplicates.items():
+            print(f"    {ip}: {', '.join(names)}", file=out)
+    else:
+        print(f"\n  {Colors.GREEN}No duplicate IP addresses.{Colors.RESET}", file=out)
+
+    # Subnet, reserved addresses and LoadBalancer pools of each stack
+    for stack, plan in network.plans.items():
+        subnet = f"{plan.subnet} via {plan.gateway}" if plan.subnet is not None else "no network declared"
+        print(f"\n  Address plan ({stack}): {subnet}", file=out)
+        for r in sorted(plan.ranges, key=lambda r: (r.first.version, r.first, r.last)):
+            print(f"    {str(r):<31} {r.label}", file=out)
+        for note in plan.notes:
+            print(f"    {Colors.YELLOW}{note}{Colors.RESET}", file=out)
+
+    # Bandwidth limits
+    if network.bandwidth_limits:
+        print(f"\n  VMs with bandwidth limits:", file=out)
+        for name, limit in network.bandwidth_limits:
+            print(f"    {name}: {limit} MB/s", file=out)
+
+    # Rate limits against each host uplink
+    if network.bridges:
+        print(f"\n  {'Host':<15} {'Bridge':<8} {'Uplink':>11} {'Limits':>11} {'Ratio':>6} {'Unlimited':>9}", file=out)
+        print(f"  {'-'*15} {'-'*8} {'-'*11} {'-'*11} {'-'*6} {'-'*9}", file=out)
+        for usage in network.bridges:
+            color = Colors.RED if usage.ratio > 1 else Colors.GREEN
+            unlimited_color = Colors.YELLOW if usage.unlimited else Colors.GREEN
+            print(f"  {usage.host:<15} {usage.bridge:<8} {usage.capacity:>6} Mb/s {usage.committed:>6} Mb/s "
+                  f"{color}{usage.ratio:>5.1f}x{Colors.RESET} {unlimited_color}{len(usage.unlimited):>9}{Colors.RESET}", file=out)
+
+def render_storage(storage: StorageReport, out: TextIO):
+    """Print section 4 (allocation per datastore, additional disks)."""
+    for ds, items in storage.datastores.items():
+        total = sum(size for _, size in items)
+        print(f"  {Colors.BOLD}Datastore: {ds}{Colors.RESET}", file=out)
+        print(f"    Total allocated: {total}GB", file=out)
+        print(f"    VMs: {len(items)}", file=out)
+        for name, size in sorted(items):
+            print(f"      {name}: {size}GB", file=out)
+        print(file=out)
+
+    # VMs with additional disks
+    if storage.additional_disks:
+        print(f"  VMs with additional disks:", file=out)
+        for name, disks in storage.additional_disks.items():
+            disks_str = ", ".join(f"{k}:{d['size']}GB on {d['datastore_id']}" + (f" ({d['filesystem']})" if d['filesystem'] else "")
+                                  for k, d in disks.items())
+            print(f"    {name}: {disks_str}", file=out)
+
+    # Per-host datastores against their declared budgets
+    if storage.pools:
+        print(f"\n  {'Host':<15} {'Datastore':<16} {'Disks':>5} {'Allocated':>10} {'Capacity':>9} {'Used':>6} {'IOPS/disk':>10} {'MB/s/disk':>10}", file=out)
+        print(f"  {'-'*15} {'-'*16} {'-'*5} {'-'*10} {'-'*9} {'-'*6} {'-'*10} {'-'*10}", file=out)
+        for pool in storage.pools:
+            pct = pool.pct
+            if pct is None:
+                used = f"{'-':>6}"
+            else:
+                color = Colors.GREEN if pct < DATASTORE_WARN_PCT else Colors.YELLOW if pct <= 100 else Colors.RED
+                used = f"{color}{pct:>5.1f}%{Colors.RESET}"
+            capacity = f"{pool.capacity}GB" if pool.capacity else "-"
+            iops = pool.iops_per_disk
+            mbps = pool.throughput_per_disk
+            print(f"  {pool.host:<15} {pool.datastore:<16} {len(pool.disks):>5} {str(pool.allocated) + 'GB':>10} {capacity:>9} {used} "
+                  f"{iops if iops is not None else '-':>10} {mbps if mbps is not None else '-':>10}", file=out)
+
+def render_kubelet(tiers: Dict[str, List[KubeletCapacity]], out: TextIO):
+    """Print section 5 (pod-allocatable capacity of the worker VMs per workload tier)."""
+    if not tiers:
+        print("  No worker VMs found.", file=out)
+        return
+    pod_cpu, pod_memory = POD_SIZE
+    print(f"  Guaranteed pod size: {pod_cpu}m CPU, {pod_memory}Mi memory\n", file=out)
+    for tier, caps in tiers.items():
+        pods = sum(cap.pods_fit(pod_cpu, pod_memory) for cap in caps)
+        color = Colors.RED if not pods else Colors.GREEN
+        print(f"  {Colors.BOLD}Tier: {tier}{Colors.RESET} ({len(caps)} worker(s), {color}{pods} guaranteed pod(s){Colors.RESET})", file=out)
+        print(f"    {'VM Name':<25} {'CPU':>6} {'Alloc':>7} {'Excl':>5} {'RAM':>8} {'Alloc':>8} {'Ovhd':>8} {'Free':>8} {'MaxPods':>8} {'Pods':>5}", file=out)
+        print(f"    {'-'*25} {'-'*6} {'-'*7} {'-'*5} {'-'*8} {'-'*8} {'-'*8} {'-'*8} {'-'*8} {'-'*5}", file=out)
+        # Overhead is conntrack plus the runtime overhead of the pods that fit; Free is what those pods get
+        overheads = [cap.conntrack_memory + cap.pod_overhead(cap.pods_fit(pod_cpu, pod_memory)) for cap in caps]
+        for cap, overhead in zip(caps, overheads):
+            excl = "-" if cap.exclusive_cpus is None else str(cap.exclusive_cpus)
+            free = max(cap.allocatable_memory - overhead, 0)
+            free_color = Colors.RED if free < pod_memory else Colors.GREEN
+            print(f"    {cap.vm:<25} {cap.cpu:>5}m {cap.allocatable_cpu:>6}m {excl:>5} {cap.memory:>6}Mi "
+                  f"{cap.allocatable_memory:>6}Mi {overhead:>6}Mi "
+                  f"{free_color}{free:>6}Mi{Colors.RESET} {cap.max_pods:>8} {cap.pods_fit(pod_cpu, pod_memory):>5}", file=out)
+        print(f"    {'Total':<25} {sum(c.cpu for c in caps):>5}m {sum(c.allocatable_cpu for c in caps):>6}m {'':>5} "
+              f"{sum(c.memory for c in caps):>6}Mi {sum(c.allocatable_memory for c in caps):>6}Mi "
+              f"{sum(overheads):>6}Mi {sum(max(c.allocatable_memory - o, 0) for c, o in zip(caps, overheads)):>6}Mi "
+              f"{'':>8} {pods:>5}", file=out)
+        print(file=out)
+
+def render_host_changes(hr: HostReport, out: TextIO):
+    """Print the per-host sections of the report for a host whose VMs changed."""
+    render_host_utilization(hr, out)
+    render_host_affinity(hr, out)
+    if hr.findings:
+        for finding in hr.findings:
+            print(f"  {format_finding(finding)}", file=out)
+    else:
+        print(f"  {Colors.GREEN}No issues found on this host.{Colors.RESET}", file=out)
+    print(file=out)
+
+def render_section(title: str, out: TextIO, first: bool = False):
+    print(f"{'' if first else chr(10)}{Colors.BOLD}{Colors.BLUE}{title}{Colors.RESET}", file=out)
+    print(f"{'-'*80}\n", file=out)
+
+def render_text(report: Report, out: TextIO):
+    """Render the report as the coloured terminal text."""
+    print(f"\n{Colors.BOLD}{'='*80}{Colors.RESET}", file=out)
+    print(f"{Colors.BOLD}{Colors.CYAN}VM RESOURCE ANALYSIS REPORT{Colors.RESET}", file=out)
+    print(f"{Colors.BOLD}{'='*80}{Colors.RESET}\n", file=out)
+
+    with PROFILE.phase("render.utilization"):
+        render_section("1. OVERALL NODE UTILIZATION", out, first=True)
+        for hr in report.hosts:
+            render_host_utilization(hr, out)
+
+    with PROFILE.phase("render.affinity"):
+        render_section("2. CPU AFFINITY ANALYSIS", out)
+        for hr in report.hosts:
+            render_host_affinity(hr, out)
+
+    with PROFILE.phase("render.network"):
+        render_section("3. NETWORK ANALYSIS", out)
+        render_network(report.network, out)
+
+    with PROFILE.phase("render.storage"):
+        render_section("4. STORAGE ANALYSIS", out)
+        render_storage(report.storage, out)
+
+    with PROFILE.phase("render.kubelet"):
+        render_section("5. KUBELET CAPACITY", out)
+        render_kubelet(report.kubelet, out)
+
+    with PROFILE.phase("render.recommendations"):
+        render_section("6. RECOMMENDATIONS", out)
+        if report.findings:
+            for finding in report.findings:
+                print(f"  {format_finding(finding)}", file=out)
+        else:
+            print(f"  {Colors.GREEN}No issues found. Configuration looks good!{Colors.RESET}", file=out)
+
+    print(f"\n{Colors.BOLD}{'='*80}{Colors.RESET}\n", file=out)
+
+# =============================================================================
+# JSON / NDJSON RENDERERS
+# =============================================================================
+
+def _mask_json(mask: int) -> dict:
+    return {"cpus": format_ranges(mask).replace(" ", ""), "count": mask.bit_count()}
+
+def finding_to_json(finding: Finding) -> dict:
+    return asdict(finding)
+
+def host_to_json(hr: HostReport) -> dict:
+    return {
+        "host": hr.host,
+        "sockets": hr.sockets,
+        "cpus": hr.cpus,
+        "memory_mb": hr.memory,
+        "vm_count": len(hr.vms),
+        "vcpu": {"allocated": hr.total_vcpu, "pct": round(hr.cpu_pct, 2)},
+        "memory": {"allocated_mb": hr.total_memory, "pct": round(hr.mem_pct, 2)},
+        "disk_gb": hr.total_disk,
+        "affinity": {
+            "used": _mask_json(hr.used),
+            "free": _mask_json(hr.free),
+            "beyond_host": _mask_json(hr.beyond),
+            "overlaps": [{"cpus": f"{s}-{e}" if s != e else str(s), "vms": names} for s, e, names in hr.overlaps],
+            "unpinned_vms": hr.no_affinity,
+        },
+        "numa_nodes": [{"cpus": format_ranges(cpus).replace(" ", ""), "memory_mb": memory, "pinned": (hr.used & cpus).bit_count()}
+                       for cpus, memory in zip(hr.topology.numa_cpus, hr.topology.numa_memory)],
+        "vms": [asdict(vm) for vm in sorted(hr.vms, key=lambda v: v.name)],
+        "findings": [finding_to_json(f) for f in hr.findings],
+    }
+
+def network_to_json(network: NetworkReport) -> dict:
+    return {
+        "ips": [{"ip": ip, "vm": name, "host": host} for ip, name, host in network.ips],
+        "duplicate_ips": network.duplicates,
+        "address_plans": {stack: {"network": str(plan.subnet) if plan.subnet is not None else None,
+                                  "gateway": str(plan.gateway) if plan.gateway is not None else None,
+                                  "ranges": [{"range": str(r), "first": str(r.first), "last": str(r.last), "label": r.label,
+                                              "kind": r.kind, "owner": r.owner or None} for r in plan.ranges],
+                                  "notes": plan.notes}
+                          for stack, plan in network.plans.items()},
+        "bandwidth_limits": dict(network.bandwidth_limits),
+        "bridges": [{"host": u.host, "bridge": u.bridge, "uplink_mbps": u.capacity, "committed_mbps": u.committed,
+                     "ratio": round(u.ratio, 2), "limits_mb_s": dict(u.limits), "unlimited": u.unlimited}
+                    for u in network.bridges],
+    }
+
+def storage_to_json(storage: StorageReport) -> dict:
+    return {
+        "datastores": {ds: {"allocated_gb": sum(size for _, size in items), "vms": dict(sorted(items))}
+                       for ds, items in storage.datastores.items()},
+        "additional_disks": storage.additional_disks,
+        "pools": [{"host": p.host, "datastore": p.datastore, "allocated_gb": p.allocated, "capacity_gb": p.capacity,
+                   "used_pct": round(p.pct, 2) if p.pct is not None else None, "iops": p.iops, "throughput_mb_s": p.throughput,
+                   "iops_per_disk": p.iops_per_disk, "throughput_per_disk_mb_s": p.throughput_per_disk,
+                   "disks": [{"vm": vm, "disk": disk, "size_gb": size} for vm, disk, size in p.disks]}
+                  for p in storage.pools],
+    }
+
+def kubelet_to_json(tiers: Dict[str, List[KubeletCapacity]]) -> dict:
+    pod_cpu, pod_memory = POD_SIZE
+    return {
+        "pod_size": {"cpu_m": pod_cpu, "memory_mi": pod_memory},
+        "tiers": {tier: {
+            "guaranteed_pods": sum(cap.pods_fit(pod_cpu, pod_memory) for cap in caps),
+            "vms": [{**asdict(cap), "allocatable_cpu": cap.allocatable_cpu,
+                     "allocatable_memory": cap.allocatable_memory, "workload_memory": cap.workload_memory,
+                     "pod_overhead": cap.pod_overhead(cap.pods_fit(pod_cpu, pod_memory)),
+                     "guaranteed_pods": cap.pods_fit(pod_cpu, pod_memory)} for cap in caps],
+        } for tier, caps in tiers.items()},
+    }
+
+def _summary_json(findings: List[Finding]) -> dict:
+    counts = {severity: sum(1 for f in findings if f.severity == severity) for severity in SEVERITY_COLORS}
+    return {"findings": counts}
+
+def render_json(report: Report, out: TextIO):
+    """Render the whole report as one JSON document."""
+    import json
+    json.dump({
+        "stacks": report.stacks,
+        "hosts": [host_to_json(hr) for hr in report.hosts],
+        "network": network_to_json(report.network),
+        "storage": storage_to_json(report.storage),
+        "kubelet": kubelet_to_json(report.kubelet),
+        "findings": [finding_to_json(f) for f in report.findings],
+        "summary": _summary_json(report.findings),
+    }, out, indent=2)
+    out.write("\n")
+
+def render_ndjson(vms: List[VM], out: TextIO, stacks: Optional[Dict[str, int]] = None,
+                  plans: Optional[AddressPlans] = None, errors: Optional[List[Finding]] = None):
+    """Stream the analysis as NDJSON, writing each host's record as soon as it is computed."""
+    import json
+
+    def emit(kind: str, payload: dict):
+        out.write(json.dumps({"type": kind, **payload}, separators=(",", ":")) + "\n")
+        out.flush()
+
+    emit("stacks", {"stacks": stacks or {}})
+    findings = list(errors or [])
+    for finding in findings:
+        emit("finding", finding_to_json(finding))
+    for host, host_vms in sorted(group_by_host(vms).items()):
+        hr = build_host_report(host, host_vms)
+        findings.extend(hr.findings)
+        emit("host", host_to_json(hr))
+    emit("network", network_to_json(build_network_report(vms, plans)))
+    emit("storage", storage_to_json(build_storage_report(vms)))
+    emit("kubelet", kubelet_to_json(build_kubelet_report(vms)))
+    fleet_findings = fleet_recommendations(vms, plans)
+    for finding in fleet_findings:
+        emit("finding", finding_to_json(finding))
+    emit("summary", _summary_json(findings + fleet_findings))
+
+def analyze_vms(vms: List[VM], out: Optional[TextIO] = None, stacks: Optional[Dict[str, int]] = None,
+                plans: Optional[AddressPlans] = None, errors: Optional[List[Finding]] = None):
+    """Analyze VMs and print the text report through a single buffered write."""
+    buffer = io.StringIO()
+    render_text(build_report(vms, stacks, plans, errors), buffer)
+    (out or sys.stdout).write(buffer.getvalue())
+
+def render_fleet(fleet: Fleet, fmt: str, out: TextIO):
+    """Render the whole fleet's report in the given --format."""
+    vms, stacks = fleet.vms, fleet.stack_counts()
+    if fmt == "json":
+        report = build_report(vms, stacks, fleet.plans, fleet.errors)
+        with PROFILE.phase("render.json"):
+            render_json(report, out)
+    elif fmt == "ndjson":
+        with PROFILE.phase("render.ndjson"):
+            render_ndjson(vms, out, stacks, fleet.plans, fleet.errors)
+    else:
+        render_preamble(out, len(vms), stacks, fleet.errors)
+        analyze_vms(vms, out, stacks=stacks, plans=fleet.plans, errors=fleet.errors)
+
+# =============================================================================
+# CPU PIN ALLOCATOR
+# =============================================================================
+
+def _lowest_cpus(mask: int, count: int) -> int:
+    """The `count` lowest set bits of mask, taken a run at a time."""
+    picked = 0
+    for start, end in mask_ranges(mask):
+        take = min(count, end - start + 1)
+        picked |= cpu_mask(take, start)
+        count -= take
+        if not count:
+            break
+    return picked
+
+def _pick_cpus(free: int, count: int, domains: List[int]) -> Tuple[int, str]:
+    """Choose `count` free CPUs, preferring one contiguous run inside one NUMA domain.
+
+    Returns (mask, note); the mask is 0 if there are not enough free CPUs.
+    """
+    # Best fit: the smallest contiguous run inside a single domain
+    best = None
+    for domain in domains:
+        for start, end in mask_ranges(free & domain):
+            length = end - start + 1
+            if length >= count and (best is None or length < best[0]):
+                best = (length, start)
+    if best:
+        return cpu_mask(count, best[1]), ""
+
+    # Staying on one NUMA node matters more than contiguity
+    roomiest = max(domains, key=lambda d: (free & d).bit_count())
+    if (free & roomiest).bit_count() >= count:
+        return _lowest_cpus(free & roomiest, count), "not contiguous"
+
+    for start, end in mask_ranges(free):
+        if end - start + 1 >= count:
+            return cpu_mask(count, start), "spans NUMA nodes"
+    if free.bit_count() >= count:
+        return _lowest_cpus(free, count), "spans NUMA nodes, not contiguous"
+    return 0, "not enough free CPUs"
+
+def _physical_cores(all_cpus: int, siblings: List[int]) -> List[int]:
+    """CPU mask per physical core, lowest CPU first; CPUs without siblings are cores of their own."""
+    cores = [core & all_cpus for core in siblings if core & all_cpus]
+    covered = 0
+    for core in cores:
+        covered |= core
+    for start, end in mask_ranges(all_cpus & ~covered):
+        cores.extend(1 << cpu for cpu in range(start, end + 1))
+    return sorted(cores, key=lambda core: core & -core)
+
+def _pick_cores(free: int, count: int, domains: List[int], cores: List[int]) -> Tuple[int, str]:
+    """Choose `count` CPUs from whole free physical cores, so no other VM gets their SMT siblings.
+
+    The NUMA domain with the fewest free cores that still suffices is preferred,
+    then free cores on any domain; siblings of occupied cores are only handed
+    out (through _pick_cpus) once no whole cores are left.
+    """
+    free_cores = [core for core in cores if core & free == core]
+
+    def take(candidates: List[int]) -> int:
+        mask, need = 0, count
+        for core in candidates:
+            threads = _lowest_cpus(core, need)
+            mask |= threads
+            need -= threads.bit_count()
+            if not need:
+                return mask
+        return 0
+
+    best = None
+    for domain in domains:
+        in_domain = [core for core in free_cores if core & domain == core]
+        if best is not None and len(in_domain) >= best[0]:
+            continue
+        mask = take(in_domain)
+        if mask:
+            best = (len(in_domain), mask)
+    if best:
+        return best[1], ""
+    mask = take(free_cores)
+    if mask:
+        return mask, "spans NUMA nodes"
+    mask, note = _pick_cpus(free, count, domains)
+    return mask, "; ".join(n for n in (note, "shares SMT cores") if n) if mask else note
+
+@dataclass
+class PinAssignment:
+    vm: VM
+    affinity: str  # proposed cpu_affinity, "" if none could be found
+    status: str  # "kept", "assigned", "reassigned" or "unplaced"
+    note: str = ""
+
+def allocate_host_pins(host: str, host_vms: List[VM], reserve_cores: Optional[int] = None) -> List[PinAssignment]:
+    """Compute non-overlapping cpu_affinity values for every VM on one host.
+
+    Existing pins are kept unless they overlap an earlier VM's pin or fall
+    outside the host; everything else is placed largest VM first. On hosts
+    with SMT siblings, VMs are given whole physical cores.
+    """
+    node_config = node_config_for(host)
+    host_cpus = node_config["cores"]
+    if reserve_cores is None:
+        reserve_cores = node_config.get("reserved_cores", 0)
+    all_cpus = cpu_mask(host_cpus)
+    reserved = cpu_mask(min(reserve_cores, host_cpus))
+    topology = node_topology(host)
+    domains = topology.numa_cpus
+    cores = _physical_cores(all_cpus, topology.siblings) if topology.siblings else None
+
+    assignments: Dict[str, PinAssignment] = {}
+    taken = 0
+    pending = []
+    for vm in host_vms:
+        mask = vm.affinity_mask
+        if not mask:
+            pending.append(vm)
+        elif mask & ~all_cpus:
+            pending.append(vm)
+            assignments[vm.name] = PinAssignment(vm, "", "reassigned", "was pinned beyond host CPUs")
+        elif mask & taken:
+            pending.append(vm)
+            assignments[vm.name] = PinAssignment(vm, "", "reassigned", "overlapped another VM")
+        else:
+            taken |= mask
+            note = "uses reserved cores" if mask & reserved else ""
+            assignments[vm.name] = PinAssignment(vm, vm.cpu_affinity, "kept", note)
+
+    free = all_cpus & ~taken & ~reserved
+    for vm in sorted(pending, key=lambda v: (-v.cpu, v.name)):
+        previous = assignments.get(vm.name)
+        status = previous.status if previous else "assigned"
+        note = previous.note if previous else ""
+        if vm.cpu <= 0:
+            mask, pick_note = 0, "no vCPU count"
+        elif cores:
+            mask, pick_note = _pick_cores(free, vm.cpu, domains, cores)
+        else:
+            mask, pick_note = _pick_cpus(free, vm.cpu, domains)
+        note = "; ".join(n for n in (note, pick_note) if n)
+        if not mask:
+            assignments[vm.name] = PinAssignment(vm, "", "unplaced", note)
+            continue
+        free &= ~mask
+        assignments[vm.name] = PinAssignment(vm, format_ranges(mask).replace(" ", ""), status, note)
+
+    return [assignments[vm.name] for vm in host_vms]
+
+def allocate_pins(vms: List[VM], reserve_cores: Optional[int] = None) -> Dict[str, List[PinAssignment]]:
+    """Run the pin allocator for every host; containers float and are left out."""
+    return {host: allocate_host_pins(host, host_vms, reserve_cores)
+            for host, host_vms in sorted(group_by_host([vm for vm in vms if vm.pinnable]).items())}
+
+def print_pin_plan(plan: Dict[str, List[PinAssignment]]):
+    """Print the proposed pinning per host followed by ready-to-paste HCL."""
+    status_colors = {
+        "kept": Colors.GREEN,
+        "assigned": Colors.CYAN,
+        "reassigned": Colors.YELLOW,
+        "unplaced": Colors.RED,
+    }
+
+    print(f"\n{Colors.BOLD}{'='*80}{Colors.RESET}")
+    print(f"{Colors.BOLD}{Colors.CYAN}CPU PIN ALLOCATION{Colors.RESET}")
+    print(f"{Colors.BOLD}{'='*80}{Colors.RESET}\n")
+
+    for host, assignments in plan.items():
+        domains = node_topology(host).numa_cpus
+        print(f"{Colors.BOLD}Host: {host}{Colors.RESET} ({node_config_for(host)['cores']} CPUs, {len(domains)} NUMA node(s))")
+        print(f"  {'VM Name':<25} {'vCPU':<6} {'Current':<12} {'Proposed':<12} {'Status':<11} Note")
+        print(f"  {'-'*25} {'-'*6} {'-'*12} {'-'*12} {'-'*11} {'-'*20}")
+        for a in sorted(assignments, key=lambda a: a.vm.name):
+            color = status_colors[a.status]
+            print(f"  {a.vm.name:<25} {a.vm.cpu:<6} {a.vm.cpu_affinity or 'N/A':<12} {a.affinity or '-':<12} {color}{a.status:<11}{Colors.RESET} {a.note}")
+
+        used = 0
+        for a in assignments:
+            used |= parse_affinity(a.affinity)
+        free = cpu_mask(node_config_for(host)["cores"]) & ~used
+        print(f"\n  Free after allocation: {format_ranges(free) or 'none'}\n")
+
+    print(f"{Colors.BOLD}Ready-to-paste cpu_affinity values:{Colors.RESET}\n")
+    for host, assignments in plan.items():
+        placed = [a for a in assignments if a.affinity]
+        if not placed:
+            continue
+        print(f'    "{host}" = {{')
+        for a in placed:
+            print(f'      "{a.vm.name}" = {{')
+            print(f'        cpu_affinity    = "{a.affinity}"')
+            print(f'      }}')
+        print(f'    }}')
+    print()
+
+# =============================================================================
+# FLEET PLACEMENT
+# =============================================================================
+
+PLACEMENT_MAX_ROUNDS = 20000
+PLACEMENT_TARGETS = 4  # least utilized hosts tried as move targets per round
+
+def _capacities(budgets: Optional[Dict[str, dict]]) -> Optional[Dict[str, Optional[int]]]:
+    return None if budgets is None else {ds: budget.get("capacity") for ds, budget in budgets.items()}
+
+class _PlacementState:
+    """Per-host load bookkeeping that is updated incrementally as VMs move."""
+
+    def __init__(self, vms: List[VM], hosts: List[str], assignment: List[str]):
+        self.vms = vms
+        self.hosts = hosts
+        self.assignment = list(assignment)  # "" = not placed yet
+        self.cores = {h: node_config_for(h)["cores"] for h in hosts}
+        self.memory = {h: node_config_for(h)["memory"] for h in hosts}
+        # Datastore capacities in GB; hosts that declare none are unconstrained
+        self.datastores = {h: _capacities(datastore_budgets(h)) for h in hosts}
+        self.disks = [vm_disk_by_datastore(vm) for vm in vms]
+        masters = sum(1 for vm in vms if vm.role == "master")
+        self.master_cap = -(-masters // len(hosts)) if masters else 0
+
+        self.cpu = dict.fromkeys(hosts, 0)
+        self.mem = dict.fromkeys(hosts, 0)
+        self.masters = dict.fromkeys(hosts, 0)
+        self.disk: Dict[str, Dict[str, int]] = {h: defaultdict(int) for h in hosts}
+        self.members: Dict[str, set] = {h: set() for h in hosts}
+        for i, host in enumerate(self.assignment):
+            if host:
+                self._add(i, host, 1)
+
+    def _add(self, i: int, host: str, sign: int):
+        vm = self.vms[i]
+        if sign > 0:
+            self.members[host].add(i)
+        else:
+            self.members[host].discard(i)
+        self.cpu[host] += sign * vm.cpu
+        self.mem[host] += sign * vm.ram_dedicated
+        self.masters[host] += sign * (vm.role == "master")
+        for ds, size in self.disks[i].items():
+            self.disk[host][ds] += sign * size
+
+    def util(self, host: str, cpu: int = 0, mem: int = 0, disks: Optional[Dict[str, int]] = None) -> float:
+        """Peak fraction of CPU, memory or declared datastore capacity used on host, plus a delta."""
+        peak = max((self.cpu[host] + cpu) / (self.cores[host] or 1),
+                   (self.mem[host] + mem) / (self.memory[host] or 1))
+        capacities = self.datastores[host]
+        if capacities:
+            for ds, size in (disks or {}).items():
+                if capacities.get(ds):
+                    peak = max(peak, (self.disk[host][ds] + size) / capacities[ds])
+        return peak
+
+    def fits(self, i: int, host: str) -> bool:
+        vm = self.vms[i]
+        if self.cpu[host] + vm.cpu > self.cores[host] or self.mem[host] + vm.ram_dedicated > self.memory[host]:
+            return False
+        if vm.role == "master" and self.masters[host] >= self.master_cap:
+            return False
+        capacities = self.datastores[host]
+        if capacities is not None:
+            for ds, size in self.disks[i].items():
+                if ds not in capacities:
+                    return False
+                if capacities[ds] is not None and self.disk[host][ds] + size > capacities[ds]:
+                    return False
+        return True
+
+    def spreads_masters(self) -> bool:
+        return all(count <= self.master_cap for count in self.masters.values())
+
+    def spread_masters(self):
+        """Move masters off hosts above the per-host cap, onto the least utilized host still below it."""
+        for host in self.hosts:
+            while self.masters[host] > self.master_cap:
+                i = max((i for i in self.members[host] if self.vms[i].role == "master"),
+                        key=lambda i: (self.vms[i].cpu, self.vms[i].ram_dedicated, self.vms[i].name))
+                below = [h for h in self.hosts if self.masters[h] < self.master_cap]
+                # Keep HA even if no host below the cap has room left
+                candidates = [h for h in below if self.fits(i, h)] or below
+                vm = self.vms[i]
+                self.move(i, min(candidates, key=lambda h: (self.util(h, vm.cpu, vm.ram_dedicated, self.disks[i]), h)))
+
+    def move(self, i: int, host: str):
+        if self.assignment[i]:
+            self._add(i, self.assignment[i], -1)
+        self.assignment[i] = host
+        self._add(i, host, 1)
+
+    def score(self) -> Tuple[float, float]:
+        """(peak utilization, sum of squared utilizations); lower is better."""
+        utils = [self.util(h) for h in self.hosts]
+        return max(utils), sum(u * u for u in utils)
+
+def _first_fit_decreasing(vms: List[VM], hosts: List[str]) -> List[str]:
+    """Place VMs largest first (masters before others) on the host left least utilized."""
+    state = _PlacementState(vms, hosts, [""] * len(vms))
+
+    avg_cores = sum(state.cores.values()) / len(hosts) or 1
+    avg_mem = sum(state.memory.values()) / len(hosts) or 1
+    order = sorted(range(len(vms)), key=lambda i: (vms[i].role != "master",
+                                                   -max(vms[i].cpu / avg_cores, vms[i].ram_dedicated / avg_mem),
+                                                   vms[i].name))
+    for i in order:
+        vm = vms[i]
+        candidates = [h for h in hosts if state.fits(i, h)] or hosts
+        best = min(candidates, key=lambda h: (state.util(h, vm.cpu, vm.ram_dedicated, state.disks[i]),
+                                              h != vm.host_node, h))
+        state.move(i, best)
+    return state.assignment
+
+def _local_search(state: _PlacementState, max_rounds: int = PLACEMENT_MAX_ROUNDS):
+    """Move or swap VMs off the most utilized host while that improves the score.
+
+    The start is first brought within the masters-per-host cap; moves and swaps
+    never break it again.
+    """
+    state.spread_masters()
+    for _ in range(max_rounds):
+        utils = {h: state.util(h) for h in state.hosts}
+        ranked = sorted(utils, key=utils.get, reverse=True)
+        hot = ranked[0]
+        peak = utils[hot]
+        base = sum(u * u for u in utils.values())
+
+        def others_peak(a: str, b: str) -> float:
+            for h in ranked:
+                if h != a and h != b:
+                    return utils[h]
+            return 0.0
+
+        def gain(a: str, b: str, new_a: float, new_b: float) -> Tuple[float, float]:
+            new_peak = max(new_a, new_b, others_peak(a, b))
+            new_sq = base - utils[a] ** 2 - utils[b] ** 2 + new_a ** 2 + new_b ** 2
+            return new_peak, new_sq
+
+        best = None  # ((peak, sumsq), action)
+        on_hot = sorted(state.members[hot])
+        # Only the least utilized hosts can be the best target for a move
+        targets = [h for h in reversed(ranked) if h != hot][:PLACEMENT_TARGETS]
+        # VMs of identical size and role evaluate identically; keep one of each
+        shapes = {}
+        for i in on_hot:
+            vm = state.vms[i]
+            shapes.setdefault((vm.cpu, vm.ram_dedicated, vm.role == "master", tuple(sorted(state.disks[i].items()))), i)
+        hot_shapes = list(shapes.values())
+        for i in hot_shapes:
+            vm = state.vms[i]
+            neg_disks = {ds: -size for ds, size in state.disks[i].items()}
+            new_hot = state.util(hot, -vm.cpu, -vm.ram_dedicated, neg_disks)
+            for target in targets:
+                if not state.fits(i, target):
+                    continue
+                new_target = state.util(target, vm.cpu, vm.ram_dedicated, state.disks[i])
+                candidate = gain(hot, target, new_hot, new_target)
+                if best is None or candidate < best[0]:
+                    best = (candidate, ("move", i, target))
+
+        if best is None or best[0] >= (peak, base - 1e-12):
+            # No single move helps; try swapping a hot VM with a smaller one elsewhere
+            if state.datastores[hot] is None:
+                for other_host in state.hosts:
+                    # Swaps are only evaluated between hosts without datastore limits
+                    if other_host == hot or state.datastores[other_host] is not None:
+                        continue
+                    others = {}
+                    for j in state.members[other_host]:
+                        other = state.vms[j]
+                        others.setdefault((other.cpu, other.ram_dedicated, other.role == "master"), j)
+                    for i in hot_shapes:
+                        vm = state.vms[i]
+                        for (cpu, mem, is_master), j in others.items():
+                            if (cpu >= vm.cpu and mem >= vm.ram_dedicated) or is_master != (vm.role == "master"):
+                                continue  # must shrink the hot host and keep master counts unchanged
+                            d_cpu, d_mem = cpu - vm.cpu, mem - vm.ram_dedicated
+                            if (state.cpu[other_host] - d_cpu > state.cores[other_host]
+                                    or state.mem[other_host] - d_mem > state.memory[other_host]):
+                                continue
+                            candidate = gain(hot, other_host, state.util(hot, d_cpu, d_mem),
+                                             state.util(other_host, -d_cpu, -d_mem))
+                            if best is None or candidate < best[0]:
+                                best = (candidate, ("swap", i, j))
+
+        if best is None or best[0] >= (peak, base - 1e-12):
+            return
+        kind, i, target = best[1]
+        if kind == "move":
+            state.move(i, target)
+        else:
+            host_i, host_j = state.assignment[i], state.assignment[target]
+            state.move(i, host_j)
+            state.move(target, host_i)
+
+@dataclass
+class Placement:
+    hosts: List[str]
+    assignment: List[str]  # proposed host per VM, same order as the input VMs
+    current_score: Tuple[float, float]
+    score: Tuple[float, float]
+    moves: List[Tuple[VM, str, str]]  # (vm, from_host, to_host)
+
+def plan_placement(vms: List[VM], hosts: Optional[List[str]] = None) -> Placement:
+    """Find a host assignment minimizing peak utilization with masters spread for HA.
+
+    Local search is run both from the current assignment and from a fresh
+    first-fit-decreasing packing; the better result wins, ties going to the
+    one that moves fewer VMs.
+    """
+    if hosts is None:
+        hosts = sorted(set(NODES) | {vm.host_node for vm in vms})
+    current = [vm.host_node if vm.host_node in hosts else hosts[0] for vm in vms]
+    current_score = _PlacementState(vms, hosts, current).score()
+
+    results = []
+    for start in (current, _first_fit_decreasing(vms, hosts)):
+        state = _PlacementState(vms, hosts, start)
+        _local_search(state)
+        moved = sum(1 for vm, host in zip(vms, state.assignment) if vm.host_node != host)
+        peak, sumsq = state.score()
+        results.append(((round(peak, 9), round(sumsq, 9), moved), state))
+    # A plan that concentrates masters never wins on balance alone
+    results = [r for r in results if r[1].spreads_masters()] or results
+    _, best = min(results, key=lambda r: r[0])
+
+    moves = [(vm, vm.host_node, host) for vm, host in zip(vms, best.assignment) if vm.host_node != host]
+    return Placement(hosts, best.assignment, current_score, best.score(), moves)
+
+def print_placement(vms: List[VM], placement: Placement):
+    """Print per-host utilization before and after, and the move plan."""
+    print(f"\n{Colors.BOLD}{'='*80}{Colors.RESET}")
+    print(f"{Colors.BOLD}{Colors.CYAN}FLEET PLACEMENT{Colors.RESET}")
+    print(f"{Colors.BOLD}{'='*80}{Colors.RESET}\n")
+
+    before = _PlacementState(vms, placement.hosts, [vm.host_node if vm.host_node in placement.hosts else placement.hosts[0] for vm in vms])
+    after = _PlacementState(vms, placement.hosts, placement.assignment)
+    print(f"  Peak utilization: {before.score()[0]*100:.1f}% -> {after.score()[0]*100:.1f}%\n")
+
+    print(f"  {'Host':<15} {'VMs':<9} {'Masters':<9} {'vCPU':<13} {'Memory (MB)':<19} {'Utilization':<15}")
+    print(f"  {'-'*15} {'-'*9} {'-'*9} {'-'*13} {'-'*19} {'-'*15}")
+    for host in placement.hosts:
+        count_before = sum(1 for h in before.assignment if h == host)
+        count_after = sum(1 for h in after.assignment if h == host)
+        util_after = after.util(host) * 100
+        color = Colors.GREEN if util_after <= 80 else Colors.YELLOW if util_after <= 100 else Colors.RED
+        print(f"  {host:<15} {f'{count_before}->{count_after}':<9} {f'{before.masters[host]}->{after.masters[host]}':<9} "
+              f"{f'{before.cpu[host]}->{after.cpu[host]}':<13} {f'{before.mem[host]}->{after.mem[host]}':<19} "
+              f"{before.util(host)*100:.1f}% -> {color}{util_after:.1f}%{Colors.RESET}")
+
+    if not placement.moves:
+        print(f"\n  {Colors.GREEN}Current placement is already balanced; no moves needed.{Colors.RESET}\n")
+        return
+
+    print(f"\n  {Colors.BOLD}Move plan ({len(placement.moves)} VMs):{Colors.RESET}")
+    for vm, src, dst in sorted(placement.moves, key=lambda m: (m[1], m[0].name)):
+        print(f"    {vm.name:<25} {src} -> {dst}")
+    pinned = [vm for vm, _, _ in placement.moves if vm.cpu_affinity]
+    if pinned:
+        print(f"\n  {Colors.YELLOW}Moved VMs with cpu_affinity need new pins on their target host; run --allocate after moving.{Colors.RESET}")
+    print()
+
+# =============================================================================
+# FAILURE SIMULATION
+# =============================================================================
+
+FAILURE_PARALLEL_MIN_SCENARIOS = 500  # below this, process start-up costs more than it saves
+FAILURE_SHOW = 15  # scenarios listed in the report, worst first
+
+@dataclass
+class FailureScenario:
+    """Outcome of restarting the VMs of failed hosts on the surviving ones."""
+    failed: Tuple[str, ...]
+    displaced: int
+    moves: List[Tuple[str, str]]  # (vm, surviving host it restarts on)
+    unplaced: List[Tuple[str, str]]  # (vm, reason)
+    masters: int
+    masters_left: int  # masters still running until the displaced ones restart
+    peak: float  # utilization of the busiest surviving host afterwards
+    peak_host: str
+
+    @property
+    def quorum(self) -> bool:
+        """Whether etcd on the surviving masters still has a majority."""
+        return not self.masters or self.masters_left > self.masters // 2
+
+    @property
+    def survivable(self) -> bool:
+        return self.quorum and not self.unplaced
+
+class _FailureModel:
+    """Baseline per-host load, computed once and shared by every scenario.
+
+    A scenario only records the load it adds to the surviving hosts that take
+    displaced VMs, so evaluating it costs time proportional to the displaced
+    VMs rather than to the whole fleet.
+    """
+
+    def __init__(self, vms: List[VM], hosts: List[str], reserve_cores: Optional[int] = None):
+        state = _PlacementState(vms, hosts, [vm.host_node if vm.host_node in hosts else hosts[0] for vm in vms])
+        self.cores, self.memory, self.datastores = state.cores, state.memory, state.datastores
+        self.cpu, self.mem = state.cpu, state.mem
+        self.disk = {h: dict(used) for h, used in state.disk.items()}
+        self.masters = sum(state.masters.values())
+        self.masters_on = dict(state.masters)
+
+        # Dedicated CPUs still free for pinned guests: not reserved and not pinned already
+        self.pins_free = {}
+        for host in hosts:
+            node_config = node_config_for(host)
+            reserved = node_config.get("reserved_cores", 0) if reserve_cores is None else reserve_cores
+            pinned = 0
+            for i in state.members[host]:
+                if vms[i].pinnable:
+                    pinned |= vms[i].affinity_mask
+            free = cpu_mask(self.cores[host]) & ~cpu_mask(min(reserved, self.cores[host])) & ~pinned
+            self.pins_free[host] = free.bit_count()
+
+        # Displaced guests per host as (name, vCPU, memory, pinned CPUs, disks), largest first
+        self.guests: Dict[str, list] = {}
+        for host in hosts:
+            members = sorted(state.members[host], key=lambda i: (-vms[i].cpu, -vms[i].ram_dedicated, vms[i].name))
+            self.guests[host] = [(vms[i].name, vms[i].cpu, vms[i].ram_dedicated,
+                                  vms[i].cpu if vms[i].pinnable and vms[i].cpu_affinity else 0, state.disks[i])
+                                 for i in members]
+        # Hosts by baseline utilization; a sorted list is already a valid heap
+        self.order = sorted((self.util(h), h) for h in hosts)
+        # Room each host has before any restarts: vCPU, memory, CPUs to pin
+        self.free = {h: (self.cores[h] - self.cpu[h], self.memory[h] - self.mem[h], self.pins_free[h]) for h in hosts}
+
+    def util(self, host: str, cpu: int = 0, mem: int = 0, disk: Optional[Dict[str, int]] = None) -> float:
+        """Peak fraction of CPU, memory or declared datastore capacity used on host, plus added load."""
+        peak = max((self.cpu[host] + cpu) / (self.cores[host] or 1),
+                   (self.mem[host] + mem) / (self.memory[host] or 1))
+        capacities = self.datastores[host]
+        if capacities:
+            for ds, cap in capacities.items():
+                if cap:
+                    peak = max(peak, (self.disk[host].get(ds, 0) + (disk or {}).get(ds, 0)) / cap)
+        return peak
+
+    def _misfit(self, host: str, guest: tuple, added: list) -> str:
+        """Why guest cannot restart on host given the load already added there, "" if it can."""
+        _, cpu, mem, pins, disks = guest
+        if self.cpu[host] + added[0] + cpu > self.cores[host]:
+            return "vCPU"
+        if self.mem[host] + added[1] + mem > self.memory[host]:
+            return "memory"
+        if pins and self.pins_free[host] - added[2] < pins:
+            return "free CPUs to pin"
+        capacities = self.datastores[host]
+        if capacities is not None:
+            for ds, size in disks.items():
+                if ds not in capacities:
+                    return f"datastore {ds}"
+                if capacities[ds] is not None and self.disk[host].get(ds, 0) + added[3].get(ds, 0) + size > capacities[ds]:
+                    return f"datastore {ds} capacity"
+        return ""
+
+    def _shortfall(self, guest: tuple, down: set) -> str:
+        """What no surviving host has enough of for guest, judged by the baseline room."""
+        _, cpu, mem, pins, _ = guest
+        room = [free for host, free in self.free.items() if host not in down]
+        if all(free[0] < cpu for free in room):
+            return "vCPU"
+        if all(free[1] < mem for free in room):
+            return "memory"
+        if all(free[2] < pins for free in room):
+            return "free CPUs to pin"
+        return "room for all of its vCPU, memory and pins"
+
+    def evaluate(self, failed: Tuple[str, ...]) -> FailureScenario:
+        """Restart the failed hosts' VMs, largest first, on the least utilized surviving host that fits."""
+        import heapq
+        down = set(failed)
+        displaced = list(heapq.merge(*(self.guests[h] for h in failed), key=lambda g: (-g[1], -g[2], g[0])))
+        # Hosts without room for even the smallest displaced guest never take one
+        min_cpu = min((g[1] for g in displaced), default=0)
+        min_mem = min((g[2] for g in displaced), default=0)
+        min_pins = min((g[3] for g in displaced), default=0)
+        free = self.free
+        heap = [entry for entry in self.order if entry[1] not in down and free[entry[1]][0] >= min_cpu
+                and free[entry[1]][1] >= min_mem and free[entry[1]][2] >= min_pins]
+        added: Dict[str, list] = {}  # host -> [vCPU, memory, pinned CPUs, {datastore: GB}]
+        moves, unplaced = [], []
+        for guest in displaced:
+            skipped, reason = [], ""
+            while heap:
+                util, host = heapq.heappop(heap)
+                load = added.setdefault(host, [0, 0, 0, defaultdict(int)])
+                misfit = self._misfit(host, guest, load)
+                if not misfit:
+                    name, cpu, mem, pins, disks = guest
+                    load[0] += cpu
+                    load[1] += mem
+                    load[2] += pins
+                    for ds, size in disks.items():
+                        load[3][ds] += size
+                    moves.append((name, host))
+                    heapq.heappush(heap, (self.util(host, load[0], load[1], load[3]), host))
+                    break
+                reason = reason or misfit  # the roomiest host's shortfall
+                skipped.append((util, host))
+            else:
+                unplaced.append((guest[0], reason or self._shortfall(guest, down)))
+            for entry in skipped:
+                heapq.heappush(heap, entry)
+
+        # Hosts filtered out above carry only their baseline load
+        touched = max(heap, default=(0.0, ""))
+        peak, peak_host = max(touched, next(((u, h) for u, h in reversed(self.order)
+                                             if h not in down and h not in added), (0.0, "")))
+        return FailureScenario(failed, len(moves) + len(unplaced), moves, unplaced, self.masters,
+                               self.masters - sum(self.masters_on[h] for h in failed), peak, peak_host)
+
+_FAILURE_MODEL: Optional[_FailureModel] = None
+
+def _init_failure_worker(model: _FailureModel):
+    global _FAILURE_MODEL
+    _FAILURE_MODEL = model
+
+def _evaluate_failures_job(scenarios: List[Tuple[str, ...]]) -> List[FailureScenario]:
+    """Process-pool worker: evaluate a chunk of scenarios against the shared model."""
+    return [_FAILURE_MODEL.evaluate(failed) for failed in scenarios]
+
+def simulate_failures(vms: List[VM], depth: int = 1, hosts: Optional[List[str]] = None,
+                      reserve_cores: Optional[int] = None, jobs: int = 1) -> List[FailureScenario]:
+    """Evaluate every combination of up to depth failed hosts, in parallel for large fleets."""
+    if hosts is None:
+        hosts = sorted(set(NODES) | {vm.host_node for vm in vms})
+    model = _FailureModel(vms, hosts, reserve_cores)
+    scenarios = [failed for k in range(1, min(depth, len(hosts) - 1) + 1)
+                 for failed in itertools.combinations(hosts, k)]
+
+    if jobs > 1 and len(scenarios) >= FAILURE_PARALLEL_MIN_SCENARIOS:
+        size = max(1, len(scenarios) // (jobs * 4))
+        chunks = [scenarios[i:i + size] for i in range(0, len(scenarios), size)]
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_failure_worker, initargs=(model,)) as pool:
+            return [result for chunk in pool.map(_evaluate_failures_job, chunks) for result in chunk]
+    return [model.evaluate(failed) for failed in scenarios]
+
+def print_failures(results: List[FailureScenario]):
+    """Print a summary per failure depth and the worst scenarios in detail."""
+    print(f"\n{Colors.BOLD}{'='*80}{Colors.RESET}")
+    print(f"{Colors.BOLD}{Colors.CYAN}FAILURE SIMULATION{Colors.RESET}")
+    print(f"{Colors.BOLD}{'='*80}{Colors.RESET}\n")
+    if not results:
+        print(f"  {Colors.YELLOW}Fewer than two hosts; there is nothing to fail over to.{Colors.RESET}\n")
+        return
+
+    for depth in sorted({len(r.failed) for r in results}):
+        at_depth = [r for r in results if len(r.failed) == depth]
+        failing = sum(1 for r in at_depth if not r.survivable)
+        worst = max(at_depth, key=lambda r: r.peak)
+        color = Colors.RED if failing else Colors.GREEN
+        print(f"  N-{depth}: {len(at_depth)} scenario(s), {color}{failing} not survivable{Colors.RESET}; "
+              f"worst-case peak utilization {worst.peak*100:.1f}% on {worst.peak_host or '-'} "
+              f"(when {', '.join(worst.failed)} fail{'s' if depth == 1 else ''})")
+
+    ranked = sorted(results, key=lambda r: (r.survivable, -len(r.unplaced), -r.peak, r.failed))
+    print(f"\n  {'Failed host(s)':<25} {'Displaced':>9} {'Unplaced':>8} {'Masters':>8} {'Quorum':<7} {'Peak after':<22}")
+    print(f"  {'-'*25} {'-'*9} {'-'*8} {'-'*8} {'-'*7} {'-'*22}")
+    for r in ranked[:FAILURE_SHOW]:
+        unplaced_color = Colors.RED if r.unplaced else Colors.GREEN
+        quorum = f"{Colors.GREEN}ok     {Colors.RESET}" if r.quorum else f"{Colors.RED}lost   {Colors.RESET}"
+        peak_color = Colors.GREEN if r.peak <= 0.8 else Colors.YELLOW if r.peak <= 1 else Colors.RED
+        print(f"  {', '.join(r.failed):<25} {r.displaced:>9} {unplaced_color}{len(r.unplaced):>8}{Colors.RESET} "
+              f"{f'{r.masters_left}/{r.masters}':>8} {quorum} {peak_color}{r.peak*100:>5.1f}%{Colors.RESET} {r.peak_host}")
+    if len(ranked) > FAILURE_SHOW:
+        print(f"  ... {len(ranked) - FAILURE_SHOW} more scenario(s)")
+
+    for r in ranked[:FAILURE_SHOW]:
+        if r.survivable:
+            break
+        print(f"\n  {Colors.BOLD}{', '.join(r.failed)} down:{Colors.RESET}")
+        if not r.quorum:
+            print(f"    {Colors.RED}etcd loses quorum: {r.masters_left} of {r.masters} masters left, "
+                  f"{r.masters // 2 + 1} needed{Colors.RESET}")
+        for name, reason in r.unplaced:
+            print(f"    {Colors.RED}{name}: no surviving host has enough {reason}{Colors.RESET}")
+    print()
+
+# =============================================================================
+# WATCH MODE
+# =============================================================================
+
+WATCH_INTERVAL = 0.05  # seconds between stat() polls
+WATCH_RESCAN_INTERVAL = 1.0  # seconds between directory walks for new files
+
+def _file_states(tf_files) -> Dict[Path, Tuple[int, int]]:
+    states = {}
+    for tf_file in tf_files:
+        try:
+            st = tf_file.stat()
+        except FileNotFoundError:
+            continue
+        states[tf_file] = (st.st_mtime_ns, st.st_size)
+    return states
+
+def watch(roots: List[Path], recursive: bool = False, cache: Optional["ParseCache"] = None,
+          jobs: int = 1, interval: float = WATCH_INTERVAL, fmt: str = "text",
+          checks: Optional[List[str]] = None, fail_fast: bool = False):
+    """Print the full report once, then re-analyze the fleet whenever a .tf file changes.
+
+    .tf files are polled with stat(); only files whose mtime or size changed
+    are re-parsed, but every check runs over the whole fleet again. Text
+    output re-prints only hosts whose VM set differs, followed by the fleet
+    findings; json and ndjson re-emit the whole report. With checks, each
+    change prints run_checks output instead.
+    """
+    # Status lines must not end up inside the JSON documents on stdout
+    status = sys.stdout if fmt == "text" or checks is not None else sys.stderr
+
+    def report(fleet: Fleet, out: TextIO):
+        if checks is not None:
+            run_checks(fleet.vms, checks, fail_fast, out=out, plans=fleet.plans, errors=fleet.errors)
+        else:
+            render_fleet(fleet, fmt, out)
+
+    def rebuild() -> Fleet:
+        # build_fleet tags VMs and resolves their IPs in place; parsed VMs outlive
+        # a poll, so it works on copies and the previous fleet stays comparable
+        return build_fleet(file_roots, {f: replace(p, vms=[replace(vm) for vm in p.vms]) for f, p in parsed.items()})
+
+    file_roots = collect_tf_files(roots, recursive)
+    states = _file_states(file_roots)
+    parsed = parse_files(list(file_roots), cache=cache, jobs=jobs)
+    fleet = rebuild()
+    by_host = group_by_host(fleet.vms)
+    out = io.StringIO()
+    report(fleet, out)
+    sys.stdout.write(out.getvalue())
+
+    print(f"Watching {len(file_roots)} .tf files for changes (Ctrl-C to stop)...\n", file=status, flush=True)
+    last_rescan = time.monotonic()
+    try:
+        while True:
+            time.sleep(interval)
+            if time.monotonic() - last_rescan >= WATCH_RESCAN_INTERVAL:
+                file_roots = collect_tf_files(roots, recursive)
+                last_rescan = time.monotonic()
+            current = _file_states(file_roots)
+            changed = [f for f, state in current.items() if states.get(f) != state]
+            removed = [f for f in states if f not in current]
+            if not changed and not removed:
+                continue
+
+            started = time.perf_counter()
+            states = current
+            for tf_file in removed:
+                parsed.pop(tf_file, None)
+            unreadable = []
+            for tf_file in changed:
+                # Changed files would all be cache misses; the next full run refreshes the cache
+                try:
+                    parsed[tf_file] = parse_tf_source(tf_file)
+                except HclSyntaxError as e:
+                    parsed[tf_file] = ParsedFile([], {}, e)
+                except (OSError, UnicodeDecodeError) as e:
+                    parsed.pop(tf_file, None)
+                    unreadable.append(Finding("critical", f"{tf_file.name}: cannot be read ({e}); its VMs were not analyzed.",
+                                              check="hcl_syntax"))
+
+            fleet = rebuild()
+            fleet.errors.extend(unreadable)
+            new_by_host = group_by_host(fleet.vms)
+            changed_hosts = sorted(h for h in set(by_host) | set(new_by_host)
+                                   if by_host.get(h) != new_by_host.get(h))
+            by_host = new_by_host
+
+            out = io.StringIO()
+            names = ", ".join(f.name for f in changed + removed)
+            print(f"{Colors.BOLD}[{time.strftime('%H:%M:%S')}] {names} changed{Colors.RESET}", file=status, flush=True)
+            if checks is not None or fmt != "text":
+                report(fleet, out)
+            else:
+                for host in changed_hosts:
+                    if host in by_host:
+                        render_host_changes(build_host_report(host, by_host[host]), out)
+                    else:
+                        print(f"{Colors.BOLD}Host: {host}{Colors.RESET} has no VMs any more\n", file=out)
+                fleet_findings = fleet.errors + fleet_recommendations(fleet.vms, fleet.plans)
+                print(f"{Colors.BOLD}Fleet:{Colors.RESET}", file=out)
+                for finding in fleet_findings:
+                    print(f"  {format_finding(finding)}", file=out)
+                if not fleet_findings:
+                    print(f"  {Colors.GREEN}No fleet-wide issues found.{Colors.RESET}", file=out)
+                print(file=out)
+            sys.stdout.write(out.getvalue())
+            sys.stdout.flush()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"  Re-analyzed {len(changed_hosts)} changed host(s) and the fleet in {elapsed_ms:.1f} ms\n",
+                  file=status, flush=True)
+    except KeyboardInterrupt:
+        print(file=status)
+
+# =============================================================================
+# DIFF MODE
+# =============================================================================
+
+# VM fields compared between the two sides, in report order
+DIFF_FIELDS = ("host_node", "cpu", "ram_dedicated", "cpu_affinity", "numa", "ip", "disk_size",
+               "datastore_id", "additional_disks", "bandwidth_limit", "workload", "kubelet_args",
+               "sysctls")
+
+@dataclass
+class VmChange:
+    stack: str  # "" for the stack at the top of each side
+    name: str
+    status: str  # "added", "removed" or "changed"
+    before: Optional[VM]
+    after: Optional[VM]
+    fields: Dict[str, Tuple[object, object]] = field(default_factory=dict)  # field -> (before, after)
+
+@dataclass
+class HostDiff:
+    """One host touched by the change, analyzed on both sides."""
+    host: str
+    before: Optional[HostReport]
+    after: Optional[HostReport]
+    introduced: List[Finding]
+    resolved: List[Finding]
+
+@dataclass
+class FleetDiff:
+    changes: List[VmChange]
+    hosts: List[HostDiff]
+    introduced: List[Finding]  # fleet-wide findings
+    resolved: List[Finding]
+    unchanged_hosts: int
+
+    @property
+    def worse(self) -> bool:
+        return bool(self.introduced or any(hd.introduced for hd in self.hosts))
+
+    @property
+    def exit_code(self) -> int:
+        """CHECK_EXIT_CODES entry of the worst introduced finding, 0 if none."""
+        introduced = self.introduced + [f for hd in self.hosts for f in hd.introduced]
+        return max((CHECK_EXIT_CODES[f.severity] for f in introduced), default=0)
+
+def diff_vms(before: List[VM], after: List[VM], root_stacks: Tuple[str, str] = ("", "")) -> List[VmChange]:
+    """Match VMs by stack and name and list what was added, removed or changed.
+
+    The stack at the top of each side is named after that side's directory,
+    so root_stacks gives those names and both are matched as "".
+    """
+    def by_key(vms: List[VM], root: str) -> Dict[Tuple[str, str], VM]:
+        return {("" if vm.stack == root else vm.stack, vm.name): vm for vm in vms}
+
+    old, new = by_key(before, root_stacks[0]), by_key(after, root_stacks[1])
+    changes = []
+    for key in sorted(old.keys() | new.keys()):
+        a, b = old.get(key), new.get(key)
+        if a is None:
+            changes.append(VmChange(*key, "added", None, b))
+        elif b is None:
+            changes.append(VmChange(*key, "removed", a, None))
+        else:
+            fields = {f: (getattr(a, f), getattr(b, f)) for f in DIFF_FIELDS if getattr(a, f) != getattr(b, f)}
+            if fields:
+                changes.append(VmChange(*key, "changed", a, b, fields))
+    return changes
+
+def _finding_delta(before: List[Finding], after: List[Finding]) -> Tuple[List[Finding], List[Finding]]:
+    old = {(f.check, f.message) for f in before}
+    new = {(f.check, f.message) for f in after}
+    return ([f for f in after if (f.check, f.message) not in old],
+            [f for f in before if (f.check, f.message) not in new])
+
+def build_diff(old_fleet: Fleet, new_fleet: Fleet, root_stacks: Tuple[str, str] = ("", "")) -> FleetDiff:
+    """Analyze only the hosts whose VMs differ between the two sides.
+
+    Fleet-wide checks always run on both sides, each against its own address
+    plans, since a finding there can change without any VM changing (e.g. an
+    edited network CIDR).
+    """
+    before, after = old_fleet.vms, new_fleet.vms
+    changes = diff_vms(before, after, root_stacks)
+    touched = set()
+    for change in changes:
+        touched.update(vm.host_node for vm in (change.before, change.after) if vm)
+
+    old_hosts, new_hosts = group_by_host(before), group_by_host(after)
+    hosts = []
+    for host in sorted(touched):
+        hr_before = build_host_report(host, old_hosts[host]) if old_hosts.get(host) else None
+        hr_after = build_host_report(host, new_hosts[host]) if new_hosts.get(host) else None
+        introduced, resolved = _finding_delta(hr_before.findings if hr_before else [],
+                                              hr_after.findings if hr_after else [])
+        hosts.append(HostDiff(host, hr_before, hr_after, introduced, resolved))
+
+    introduced, resolved = _finding_delta(old_fleet.errors + fleet_recommendations(before, old_fleet.plans),
+                                          new_fleet.errors + fleet_recommendations(after, new_fleet.plans))
+    all_hosts = old_hosts.keys() | new_hosts.keys()
+    return FleetDiff(changes, hosts, introduced, resolved, len(all_hosts - touched))
+
+def _diff_value(value: object) -> str:
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{k}: {_diff_value(v)}" for k, v in value.items()) + "}" if value else "{}"
+    return str(value) if value not in ("", None) else "-"
+
+def _host_usage(hr: Optional[HostReport]) -> str:
+    if hr is None:
+        return "no VMs"
+    return f"{hr.total_vcpu}/{hr.cpus} vCPU ({hr.cpu_pct:.1f}%), {hr.total_memory}/{hr.memory}MB ({hr.mem_pct:.1f}%)"
+
+def _change_label(change: VmChange) -> str:
+    return f"{change.stack}/{change.name}" if change.stack else change.name
+
+def render_diff(diff: FleetDiff, out: TextIO):
+    """Print the VM deltas and, per touched host, utilization and findings before and after."""
+    print(f"{Colors.BOLD}VM changes ({len(diff.changes)}):{Colors.RESET}", file=out)
+    if not diff.changes:
+        print(f"  {Colors.GREEN}No VM differs between the two sides.{Colors.RESET}", file=out)
+    for change in diff.changes:
+        label = _change_label(change)
+        if change.status == "added":
+            vm = change.after
+            print(f"  {Colors.GREEN}+ {label}{Colors.RESET} on {vm.host_node}: {vm.cpu} vCPU, {vm.ram_dedicated}MB, "
+                  f"affinity {vm.cpu_affinity or '-'}, ip {vm.ip or '-'}", file=out)
+        elif change.status == "removed":
+            print(f"  {Colors.RED}- {label}{Colors.RESET} from {change.before.host_node}", file=out)
+        else:
+            deltas = ", ".join(f"{name} {_diff_value(a)} -> {_diff_value(b)}" for name, (a, b) in change.fields.items())
+            print(f"  {Colors.YELLOW}~ {label}{Colors.RESET} on {change.after.host_node}: {deltas}", file=out)
+
+    print(f"\n{Colors.BOLD}Affected hosts ({len(diff.hosts)}, {diff.unchanged_hosts} unchanged and not re-analyzed):{Colors.RESET}", file=out)
+    for hd in diff.hosts:
+        print(f"  {Colors.BOLD}{hd.host}{Colors.RESET}: {_host_usage(hd.before)} -> {_host_usage(hd.after)}", file=out)
+        for finding in hd.introduced:
+            print(f"    + {format_finding(finding)}", file=out)
+        for finding in hd.resolved:
+            print(f"    {Colors.GREEN}resolved{Colors.RESET} {format_finding(finding)}", file=out)
+    for finding in diff.introduced:
+        print(f"  + {format_finding(finding)}", file=out)
+    for finding in diff.resolved:
+        print(f"  {Colors.GREEN}resolved{Colors.RESET} {format_finding(finding)}", file=out)
+
+    new_count = len(diff.introduced) + sum(len(hd.introduced) for hd in diff.hosts)
+    if new_count:
+        print(f"\n{Colors.RED}{Colors.BOLD}This change introduces {new_count} finding(s).{Colors.RESET}\n", file=out)
+    else:
+        print(f"\n{Colors.GREEN}No host got worse.{Colors.RESET}\n", file=out)
+
+def _usage_json(hr: Optional[HostReport]) -> Optional[dict]:
+    if hr is None:
+        return None
+    return {"vcpu": hr.total_vcpu, "cpus": hr.cpus, "cpu_pct": round(hr.cpu_pct, 2),
+            "memory_mb": hr.total_memory, "host_memory_mb": hr.memory, "mem_pct": round(hr.mem_pct, 2)}
+
+def change_to_json(change: VmChange) -> dict:
+    return {"stack": change.stack, "vm": change.name, "status": change.status,
+            "host": (change.after or change.before).host_node,
+            "fields": {name: {"before": a, "after": b} for name, (a, b) in change.fields.items()}}
+
+def host_diff_to_json(hd: HostDiff) -> dict:
+    return {"host": hd.host, "before": _usage_json(hd.before), "after": _usage_json(hd.after),
+            "introduced": [finding_to_json(f) for f in hd.introduced],
+            "resolved": [finding_to_json(f) for f in hd.resolved]}
+
+def diff_to_json(diff: FleetDiff) -> dict:
+    return {
+        "changes": [change_to_json(c) for c in diff.changes],
+        "hosts": [host_diff_to_json(hd) for hd in diff.hosts],
+        "fleet": {"introduced": [finding_to_json(f) for f in diff.introduced],
+                  "resolved": [finding_to_json(f) for f in diff.resolved]},
+        "unchanged_hosts": diff.unchanged_hosts,
+        "worse": diff.worse,
+    }
+
+def render_diff_ndjson(diff: FleetDiff, out: TextIO):
+    """Write the diff as NDJSON: one record per VM change, affected host and fleet-wide finding."""
+    import json
+
+    def emit(kind: str, payload: dict):
+        out.write(json.dumps({"type": kind, **payload}, separators=(",", ":")) + "\n")
+
+    for change in diff.changes:
+        emit("change", change_to_json(change))
+    for hd in diff.hosts:
+        emit("host", host_diff_to_json(hd))
+    for status, findings in (("introduced", diff.introduced), ("resolved", diff.resolved)):
+        for finding in findings:
+            emit("finding", {"status": status, **finding_to_json(finding)})
+    emit("summary", {"unchanged_hosts": diff.unchanged_hosts, "worse": diff.worse})
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze Terraform VM configurations")
+    parser.add_argument("--dir", type=str, nargs="+", default=["."], help="Directories containing .tf files")
+    parser.add_argument("--tf-json", action="append", default=[], metavar="PATH",
+                        help="Read VMs from `terraform show -json` state/plan output instead of .tf files ('-' for stdin)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Scan every stack below the given directories")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Parallel parse processes")
+    parser.add_argument("--cache", action="store_true",
+                        help=f"Reuse parsed .tf files across runs, stored in {DEFAULT_CACHE_FILE}")
+    parser.add_argument("--cache-file", type=str, help="Parse cache location (implies --cache)")
+    parser.add_argument("--format", choices=["text", "json", "ndjson"], default="text",
+                        help="Report format: coloured text, one JSON document, or NDJSON streamed per host")
+    parser.add_argument("--diff", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two directories (e.g. two git worktrees) and analyze only the hosts that changed; "
+                             "exits 3 or 4 like --check if the change introduces findings")
+    parser.add_argument("--watch", action="store_true", help="Keep running and re-analyze the fleet when a .tf file changes")
+    parser.add_argument("--allocate", action="store_true", help="Propose non-overlapping cpu_affinity values instead of the report")
+    parser.add_argument("--nodes", action="append", default=[], metavar="PATH",
+                        help="Merge a JSON node inventory (e.g. the nodes.json vm-analyzer-bench.py --generate-fleet writes) into NODES")
+    parser.add_argument("--topology", action="append", default=[], metavar="HOST=PATH",
+                        help="Load a host's NUMA/SMT topology (lscpu -p dump, sysfs node/ copy, YAML or JSON)")
+    parser.add_argument("--place", action="store_true", help="Propose a balanced host for every VM and print the move plan")
+    parser.add_argument("--check", nargs="*", metavar="CHECK",
+                        help="Only run the given checks (default: all) and print violations; "
+                             "exits 3 on warnings, 4 on critical findings")
+    parser.add_argument("--fail-fast", action="store_true", help="Stop --check at the first violation")
+    parser.add_argument("--simulate-failures", action="store_true",
+                        help="Check whether the other hosts can absorb the VMs of each failed host; "
+                             "exits 4 like a critical --check finding if one cannot")
+    parser.add_argument("--failures", type=int, choices=[1, 2], default=1,
+                        help="Hosts failing at once in --simulate-failures (2 also covers every pair)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-phase time, allocations and counters to stderr (parses in-process)")
+    parser.add_argument("--profile-dump", metavar="PATH", help="Also write cProfile stats for pstats/snakeviz to PATH")
+    parser.add_argument("--pod-size", metavar="CPU,MEMORY", default="1,1Gi",
+                        help="Guaranteed pod counted in the kubelet capacity section (default: 1,1Gi)")
+    parser.add_argument("--reserve-cores", type=int, default=None, help="CPUs to keep free for Proxmox when allocating (default: per-node reserved_cores)")
+    args = parser.parse_args()
+
+    if not (args.profile or args.profile_dump):
+        run(args)
+        return
+
+    # Parse worker processes would be invisible to both profilers
+    args.jobs = 1
+    cprofile = None
+    if args.profile_dump:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    if args.profile:
+        PROFILE.start()
+    try:
+        run(args)
+    finally:
+        if cprofile:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_dump)
+        if args.profile:
+            PROFILE.stop()
+            print_profile(PROFILE, sys.stderr)
+
+def run(args: argparse.Namespace):
+    """Carry out the mode selected on the command line."""
+    directories = [Path(d) for d in args.dir]
+    for directory in directories:
+        if not directory.exists():
+            print(f"Error: Directory '{directory}' does not exist")
+            sys.exit(1)
+
+    overrides = {}
+    for spec in args.topology:
+        host, sep, path = spec.partition("=")
+        if not sep:
+            print(f"Error: --topology expects HOST=PATH, got '{spec}'")
+            sys.exit(1)
+        overrides[host] = path
+    try:
+        for path in args.nodes:
+            load_nodes(Path(path))
+        load_node_topologies(overrides)
+        set_pod_size(args.pod_size)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args.check:
+        unknown = [name for name in args.check if name not in HOST_CHECKS and name not in FLEET_CHECKS]
+        if unknown:
+            print(f"Error: unknown check '{unknown[0]}' (choose from {', '.join([*HOST_CHECKS, *FLEET_CHECKS])})")
+            sys.exit(1)
+
+    cache = None
+    if args.cache or args.cache_file:
+        cache = ParseCache(Path(args.cache_file or DEFAULT_CACHE_FILE))
+
+    if args.diff:
+        sides, root_stacks = [], []
+        for side in args.diff:
+            if not Path(side).is_dir():
+                print(f"Error: Directory '{side}' does not exist")
+                sys.exit(1)
+            sides.append(scan_stacks([Path(side)], recursive=args.recursive, cache=cache, jobs=args.jobs))
+            root_stacks.append(Path(side).resolve().name)
+        with PROFILE.phase("analysis.diff"):
+            diff = build_diff(*sides, root_stacks=tuple(root_stacks))
+        if args.format == "text":
+            out = io.StringIO()
+            render_diff(diff, out)
+            sys.stdout.write(out.getvalue())
+        elif args.format == "ndjson":
+            render_diff_ndjson(diff, sys.stdout)
+        else:
+            import json
+            json.dump(diff_to_json(diff), sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        sys.exit(diff.exit_code)
+
+    if args.watch:
+        watch(directories, recursive=args.recursive, cache=cache, jobs=args.jobs, fmt=args.format,
+              checks=None if args.check is None else args.check or [*HOST_CHECKS, *FLEET_CHECKS],
+              fail_fast=args.fail_fast)
+        return
+
+    if args.tf_json:
+        try:
+            with PROFILE.phase("read.tf_json"):
+                fleet = load_tf_json(args.tf_json)
+        except (OSError, ValueError) as e:
+            print(f"Error: cannot read Terraform JSON: {e}")
+            sys.exit(1)
+    else:
+        fleet = scan_stacks(directories, recursive=args.recursive, cache=cache, jobs=args.jobs)
+
+    vms = fleet.vms
+    if not vms and not fleet.errors:
+        print("No VMs found in Terraform files")
+        sys.exit(1)
+
+    if args.check is not None:
+        with PROFILE.phase("check"):
+            code = run_checks(vms, args.check or [*HOST_CHECKS, *FLEET_CHECKS], args.fail_fast,
+                              plans=fleet.plans, errors=fleet.errors)
+        sys.exit(code)
+
+    if args.format != "text":
+        render_fleet(fleet, args.format, sys.stdout)
+        return
+
+    stacks = fleet.stack_counts()
+
+    out = io.StringIO()
+    render_preamble(out, len(vms), stacks, fleet.errors)
+    sys.stdout.write(out.getvalue())
+    if args.allocate:
+        with PROFILE.phase("allocate"):
+            plan = allocate_pins(vms, args.reserve_cores)
+        print_pin_plan(plan)
+        return
+    if args.place:
+        with PROFILE.phase("place"):
+            placement = plan_placement(vms)
+        print_placement(vms, placement)
+        return
+    if args.simulate_failures:
+        with PROFILE.phase("simulate_failures"):
+            results = simulate_failures(vms, args.failures, reserve_cores=args.reserve_cores, jobs=args.jobs)
+        print_failures(results)
+        # A scenario that loses quorum or strands VMs is a critical finding, as in --check
+        sys.exit(0 if all(r.survivable for r in results) else CHECK_EXIT_CODES["critical"])
+    analyze_vms(vms, stacks=stacks, plans=fleet.plans, errors=fleet.errors)
+
+if __name__ == "__main__":
+    main()